@@ -0,0 +1,328 @@
+"""Export pipeline behind the /events.* feeds.
+
+Each event is reduced once to a compact export record, which is cached for
+as long as the event is not updated. Every feed format is a Formatter that
+renders a list of those records, so adding a format adds no query and no
+per-event rework.
+"""
+from google.appengine.api import memcache
+from django.utils import simplejson
+from icalendar import Event as CalendarEvent
+from xml.sax.saxutils import escape
+from datetime import datetime
+import urllib
+import time
+import zlib
+import re
+import pytz
+
+from models import Event, Feedback, HDLog
+from utils import event_path
+
+RECORD_BATCH_SIZE = 100
+RECORD_CACHE_KEY = 'export_record:%s:%s' # event id, updated
+VEVENT_CACHE_KEY = 'vevent:%s:%s:%s:%s' # formatter, url base, event id, updated
+RSS_ITEM_CACHE_KEY = 'rss_item:%s:%s:%s' # url base, event id, updated
+RSS_ENCODING = 'iso-8859-1'
+RSS_DATE = '%a, %d %b %Y %H:%M:%S GMT'
+EXPORT_CACHE_TTL = 86400 # seconds
+BODY_CACHE_KEY = 'feed_response:%s:%s' # content coding, etag
+MAX_CACHED_BODY = 1000000 # bytes, the memcache value limit
+GZIP_WBITS = 16 + zlib.MAX_WBITS # deflate with a gzip header and trailer
+HISTORY_TIME_BUDGET = 20 # seconds, well inside the request deadline
+
+EMPTY_FIELD = re.compile(r'^__.*?:[ ,]*$\n*', re.M)
+FIELD_MARK = re.compile(r'^__', re.M)
+
+def export_record(event):
+    """Return the fields of event that any export needs."""
+    # make verbose description with empty fields where information is missing
+    description = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
+        event.status,
+        event.owner(),
+        event.type,
+        event.estimated_size,
+        event.url,
+        event.fee,
+        event.contact_name,
+        event.contact_phone,
+        event.roomlist(),
+        event.details,
+        event.notes)
+    # then delete the empty fields with a regex
+    description = FIELD_MARK.sub('', EMPTY_FIELD.sub('', description))
+    return {
+        'id': event.key().id(),
+        'path': event_path(event),
+        'name': event.name,
+        'status': event.status,
+        'member': event.member.email(),
+        'type': event.type,
+        'estimated_size': event.estimated_size,
+        'rooms': event.rooms,
+        'details': event.details,
+        'description': description,
+        'start_time': event.start_time,
+        'end_time': event.end_time,
+        'updated': event.updated,
+    }
+
+def export_records(events):
+    """Return the export records of events, building only those of events
+    updated since they were last cached."""
+    keys = [RECORD_CACHE_KEY % (e.key().id(), e.updated) for e in events]
+    records = memcache.get_multi(keys)
+    missing = {}
+    for key, event in zip(keys, events):
+        if key not in records:
+            missing[key] = records[key] = export_record(event)
+    if missing:
+        memcache.set_multi(missing, EXPORT_CACHE_TTL)
+    return [records[key] for key in keys]
+
+def batches(iterable, size):
+    """Generate lists of up to size consecutive items of iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_records(events):
+    """Generate the export records of an iterable of events, looking them
+    up in memcache one batch at a time as the events arrive."""
+    for batch in batches(events, RECORD_BATCH_SIZE):
+        for record in export_records(batch):
+            yield record
+
+def cached_fragments(records, key, render):
+    """Generate render(record) for each record, reusing the text cached
+    under key(record) and caching the rest, one batch at a time."""
+    for batch in batches(records, RECORD_BATCH_SIZE):
+        keys = map(key, batch)
+        fragments = memcache.get_multi(keys)
+        missing = {}
+        for k, record in zip(keys, batch):
+            if k in fragments:
+                yield fragments[k]
+            else:
+                missing[k] = render(record)
+                yield missing[k]
+        if missing:
+            memcache.set_multi(missing, EXPORT_CACHE_TTL)
+
+def xml_element(name, text):
+    return '<%s>%s</%s>' % (name, escape(text), name)
+
+def accepts_gzip(request):
+    """Does the client take gzip-encoded responses?
+
+    A coding given q=0 is refused, and * stands for any coding not named.
+    """
+    qvalues = {}
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        params = coding.split(';')
+        q = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[params[0].strip().lower()] = q
+    return qvalues.get('gzip', qvalues.get('*', 0)) > 0
+
+def cached_body(etag, render, gzipped=False, page=None):
+    """Generate the body of the feed response identified by etag.
+
+    A body is kept in memcache under its etag for each content coding, so
+    it is rendered and compressed once per calendar version. Otherwise the
+    chunks of render() are streamed, compressed on the fly if gzipped.
+    Whatever render() puts in the page dict, like the cursor to continue
+    from, is cached along with the body and restored with it.
+    """
+    if page is None:
+        page = {}
+    key = BODY_CACHE_KEY % (gzipped and 'gzip' or 'identity', etag)
+    cached = memcache.get(key)
+    if cached is not None:
+        body, cached_page = cached
+        page.update(cached_page)
+        yield body
+        return
+    compressor = gzipped and zlib.compressobj(9, zlib.DEFLATED, GZIP_WBITS)
+    parts, size = [], 0
+    for chunk in render():
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+            size += len(chunk)
+            if size <= MAX_CACHED_BODY:
+                parts.append(chunk)
+    if compressor:
+        chunk = compressor.flush()
+        yield chunk
+        size += len(chunk)
+        parts.append(chunk)
+    if size <= MAX_CACHED_BODY:
+        memcache.set(key, (''.join(parts), page), EXPORT_CACHE_TTL)
+
+def history_record(event):
+    """Return every property of event, with its RSVP, feedback and log
+    counts."""
+    d = event.to_dict()
+    d['rsvp_count'] = event.rsvp_count()
+    d['feedback_count'] = Feedback.all(keys_only=True).filter('event =', event).count()
+    d['log_count'] = HDLog.all(keys_only=True).filter('event =', event).count()
+    return d
+
+def iter_history(cursor=None, budget=HISTORY_TIME_BUDGET):
+    """Generate the newline-delimited JSON export of every event.
+
+    Each page of events is followed by a {"cursor": ...} line. Paging stops
+    once budget seconds have passed, and the export resumes from the last
+    cursor given. The cursor is null after the last page.
+    """
+    deadline = time.time() + budget
+    while True:
+        events, cursor = Event.get_history_page(cursor)
+        for event in events:
+            yield simplejson.dumps(history_record(event)) + '\n'
+        yield simplejson.dumps({'cursor': cursor}) + '\n'
+        if cursor is None or time.time() > deadline:
+            return
+
+
+class Formatter(object):
+    """Renders export records as one feed format.
+
+    Subclasses define render(records, url_base, params), which generates the
+    feed body in chunks. records is an iterable of export records in feed
+    order, url_base the scheme and host that event links are made absolute
+    with, and params the request's query parameters.
+    """
+    content_type = 'text/plain'
+    # feed only the events flagged as large
+    large_only = False
+
+
+class IcsFormatter(Formatter):
+    name = 'ics'
+    content_type = 'text/calendar'
+
+    def summary(self, record):
+        if record['status'] == 'approved':
+            return record['name']
+        return record['name'] + ' (%s)' % record['status'].upper()
+
+    def vevent(self, record, url_base):
+        """Return the folded VEVENT text of record."""
+        iev = CalendarEvent()
+        iev.add('summary', self.summary(record))
+        ev_url = url_base + record['path']
+        iev.add('description', record['description'] + '\n--\n' + ev_url)
+        iev.add('url', ev_url)
+        if record['start_time']:
+            iev.add('dtstart', record['start_time'].replace(tzinfo=pytz.timezone('US/Pacific')))
+        if record['end_time']:
+            iev.add('dtend', record['end_time'].replace(tzinfo=pytz.timezone('US/Pacific')))
+        return iev.as_string()
+
+    def render(self, records, url_base, params):
+        yield 'BEGIN:VCALENDAR\r\n'
+        # each event's VEVENT text is cached until the event is updated
+        for fragment in cached_fragments(records,
+                lambda r: VEVENT_CACHE_KEY % (self.name, url_base, r['id'], r['updated']),
+                lambda r: self.vevent(r, url_base)):
+            yield fragment
+        yield 'END:VCALENDAR\r\n'
+
+
+class LargeIcsFormatter(IcsFormatter):
+    name = 'large_ics'
+    large_only = True
+
+    def summary(self, record):
+        return record['name'] + ' (%s)' % record['estimated_size']
+
+
+class RssFormatter(Formatter):
+    """Writes the same RSS 2.0 document as PyRSS2Gen.RSS2, by concatenating
+    the channel around each event's escaped <item>, which is cached until
+    the event is updated."""
+    content_type = 'application/xml'
+    title = 'Hacker Dojo Events Feed'
+    description = 'Upcoming events at the Hacker Dojo in Mountain View, CA'
+    generator = 'PyRSS2Gen-1.0.0'
+    docs = 'http://blogs.law.harvard.edu/tech/rss'
+
+    def item(self, record, url_base):
+        """Return the <item> XML of record, encoded for the feed."""
+        link = url_base + record['path']
+        parts = [xml_element('title', record['name']), xml_element('link', link)]
+        if record['details'] is not None:
+            parts.append(xml_element('description', record['details']))
+        parts.append(xml_element('guid', link))
+        parts.append(xml_element('pubDate', record['updated'].strftime(RSS_DATE)))
+        return (u'<item>%s</item>' % ''.join(parts)).encode(RSS_ENCODING, 'xmlcharrefreplace')
+
+    def render(self, records, url_base, params):
+        channel = ''.join([
+            xml_element('title', self.title),
+            xml_element('link', url_base),
+            xml_element('description', self.description),
+            xml_element('lastBuildDate', datetime.now().strftime(RSS_DATE)),
+            xml_element('generator', self.generator),
+            xml_element('docs', self.docs)])
+        yield '<?xml version="1.0" encoding="%s"?>\n<rss version="2.0"><channel>' % RSS_ENCODING
+        yield channel.encode(RSS_ENCODING, 'xmlcharrefreplace')
+        for fragment in cached_fragments(records,
+                lambda r: RSS_ITEM_CACHE_KEY % (url_base, r['id'], r['updated']),
+                lambda r: self.item(r, url_base)):
+            yield fragment
+        yield '</channel></rss>'
+
+    def write_xml(self, outfile, records, url_base):
+        """Write the feed of records to outfile as it is generated."""
+        for chunk in self.render(records, url_base, {}):
+            outfile.write(chunk)
+
+
+class JsonFormatter(Formatter):
+    content_type = 'application/json'
+    FIELDS = ['id', 'member', 'name', 'type', 'estimated_size', 'rooms', 'status',
+              'start_time', 'end_time']
+
+    def summarize(self, record):
+        """Return the same fields as Event.to_dict(summarize=True)."""
+        d = {}
+        for prop in self.FIELDS:
+            if prop in ['start_time', 'end_time']:
+                if record[prop]:
+                    d[prop] = record[prop].strftime('%Y-%m-%dT%H:%M:%S')
+            else:
+                d[prop] = record[prop]
+        return d
+
+    def render(self, records, url_base, params):
+        events = map(self.summarize, records)
+        # narrow the list down by any summarized field given as a parameter
+        for k in params:
+            value = urllib.unquote(params[k])
+            events = [e for e in events if k not in e or unicode(e[k]) == value]
+        yield simplejson.dumps(events)
+
+
+FORMATTERS = {
+    'ics': IcsFormatter(),
+    'large_ics': LargeIcsFormatter(),
+    'rss': RssFormatter(),
+    'json': JsonFormatter(),
+}
@@ -59,6 +59,19 @@ INLINE = CaselessDict(
 
 _marker = []
 
+class LazyProperty(object):
+    "The text of a parsed property, kept until the property is first used"
+    __slots__ = ('params', 'value', 'strict')
+
+    def __init__(self, params, value, strict=False):
+        self.params = params # as written, see Contentline.raw_parts
+        self.value = value
+        self.strict = strict # of the content line it was read from
+
+    def __repr__(self):
+        return 'LazyProperty(%r, %r)' % (self.params, self.value)
+
+
 class Component(CaselessDict):
     """
     Component is the base object for calendar, Event and the other components
@@ -133,6 +146,18 @@ class Component(CaselessDict):
     >>> [i['dtstart'] for i in c.walk('VEVENT')]
     ['20000101T000000']
 
+    Instead of rendering everything into one string, a component can be
+    streamed as folded content lines, each ending in CRLF.
+    >>> list(c.iter_lines())
+    ['BEGIN:VCALENDAR\\r\\n', 'ATTENDEE:Max M\\r\\n', 'BEGIN:VEVENT\\r\\n', 'DTEND:20000102T000000\\r\\n', 'DTSTART:20000101T000000\\r\\n', 'SUMMARY:A brief history of time\\r\\n', 'END:VEVENT\\r\\n', 'END:VCALENDAR\\r\\n']
+
+    or written straight to a file like object.
+    >>> from StringIO import StringIO
+    >>> out = StringIO()
+    >>> c.write_to(out)
+    >>> out.getvalue() == c.as_string()
+    True
+
     INLINE properties have their values on one property line. Note the double
     quoting of the value with a colon in it.
     >>> c = Calendar()
@@ -185,6 +210,117 @@ class Component(CaselessDict):
         self.subcomponents = [] # Components can be nested.
 
 
+    ########################################################################
+    # Lazily parsed properties. Components parsed with lazy=True hold the
+    # text of each property, and the names of those not yet converted to
+    # their value types are kept in _lazy.
+
+    _lazy = ()
+
+    def _add_lazy(self, name, value):
+        "Adds a LazyProperty, making a list of repeated properties"
+        name = name.upper()
+        if dict.__contains__(self, name):
+            oldval = dict.__getitem__(self, name)
+            if type(oldval) == ListType:
+                oldval.append(value)
+            else:
+                dict.__setitem__(self, name, [oldval, value])
+        else:
+            dict.__setitem__(self, name, value)
+        if not self._lazy:
+            self._lazy = set()
+        self._lazy.add(name)
+
+    def _resolve(self, name):
+        "Converts the lazy values of property name to their value types"
+        self._lazy.discard(name)
+        value = dict.__getitem__(self, name)
+        if type(value) == ListType:
+            value = [self._parse_lazy(name, v) for v in value]
+        else:
+            value = self._parse_lazy(name, value)
+        dict.__setitem__(self, name, value)
+
+    def _parse_lazy(self, name, value):
+        if not isinstance(value, LazyProperty):
+            return value
+        factory = types_factory.for_property(name)
+        vals = factory(factory.from_ical(value.value))
+        vals.params = Parameters.from_items(value.params, strict=value.strict)
+        return vals
+
+    def _resolve_all(self):
+        for name in list(self._lazy):
+            self._resolve(name)
+
+    def __getitem__(self, name):
+        if self._lazy and name.upper() in self._lazy:
+            self._resolve(name.upper())
+        return CaselessDict.__getitem__(self, name)
+
+    def __setitem__(self, name, value):
+        if self._lazy:
+            self._lazy.discard(name.upper())
+        CaselessDict.__setitem__(self, name, value)
+
+    def __delitem__(self, name):
+        if self._lazy:
+            self._lazy.discard(name.upper())
+        CaselessDict.__delitem__(self, name)
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def setdefault(self, name, value=None):
+        if name in self:
+            return self[name]
+        self[name] = value
+        return value
+
+    def pop(self, name, default=None):
+        if name in self:
+            value = self[name]
+            del self[name]
+            return value
+        return default
+
+    def popitem(self):
+        self._resolve_all()
+        return CaselessDict.popitem(self)
+
+    def copy(self):
+        self._resolve_all()
+        return CaselessDict.copy(self)
+
+    def items(self):
+        self._resolve_all()
+        return CaselessDict.items(self)
+
+    def iteritems(self):
+        self._resolve_all()
+        return CaselessDict.iteritems(self)
+
+    def values(self):
+        self._resolve_all()
+        return CaselessDict.values(self)
+
+    def itervalues(self):
+        self._resolve_all()
+        return CaselessDict.itervalues(self)
+
+    def __eq__(self, other):
+        self._resolve_all()
+        if isinstance(other, Component):
+            other._resolve_all()
+        return CaselessDict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+
 #    def non_complience(self, warnings=0):
 #        """
 #        not implemented yet!
@@ -240,6 +376,12 @@ class Component(CaselessDict):
 
     def decoded(self, name, default=_marker):
         "Returns decoded value of property"
+        if self._lazy and name.upper() in self._lazy:
+            # decode straight from the text, skipping the value type
+            value = dict.__getitem__(self, name.upper())
+            if type(value) == ListType:
+                return [types_factory.from_ical(name, v.value) for v in value]
+            return types_factory.from_ical(name, value.value)
         if name in self:
             value = self[name]
             if type(value) == ListType:
@@ -313,8 +455,16 @@ class Component(CaselessDict):
         Returns properties in this component and subcomponents as:
         [(name, value), ...]
         """
+        return list(self.iter_property_items())
+
+
+    def iter_property_items(self):
+        """
+        Generates the (name, value) pairs of property_items() one at a time,
+        without building the list for the whole tree.
+        """
         vText = types_factory['text']
-        properties = [('BEGIN', vText(self.name).ical())]
+        yield ('BEGIN', vText(self.name).ical())
         property_names = self.keys()
         property_names.sort()
         for name in property_names:
@@ -322,26 +472,107 @@ class Component(CaselessDict):
             if type(values) == ListType:
                 # normally one property is one line
                 for value in values:
-                    properties.append((name, value))
+                    yield (name, value)
             else:
-                properties.append((name, values))
+                yield (name, values)
         # recursion is fun!
         for subcomponent in self.subcomponents:
-            properties += subcomponent.property_items()
-        properties.append(('END', vText(self.name).ical()))
-        return properties
+            for item in subcomponent.iter_property_items():
+                yield item
+        yield ('END', vText(self.name).ical())
+
+
+    def from_string(st, multiple=False, lazy=False):
+        """
+        Populates the component recursively from a string. With lazy set,
+        property values are only parsed when first used, see iter_from_lines.
+        """
+        comps = list(Component.iter_from_lines(Contentlines.from_string(st),
+                                               lazy=lazy))
+        if multiple:
+            return comps
+        if not len(comps) == 1:
+            raise ValueError('Found multiple components where '
+                             'only one is allowed')
+        return comps[0]
+    from_string = staticmethod(from_string)
 
+    def iter_from_file(fileobj, lazy=False):
+        """
+        Parses an iCalendar file object incrementally. Each subcomponent of a
+        top level component is generated as soon as its END line is read, and
+        is not added to its parent. The top level component follows once it
+        ends, holding only its own properties.
+        >>> from StringIO import StringIO
+        >>> f = StringIO('BEGIN:VCALENDAR\\r\\nPRODID:-//test//\\r\\n'
+        ...     'BEGIN:VEVENT\\r\\nSUMMARY:One\\r\\nEND:VEVENT\\r\\n'
+        ...     'BEGIN:VEVENT\\r\\nSUMMARY:Tw\\r\\n o\\r\\nEND:VEVENT\\r\\nEND:VCALENDAR\\r\\n')
+        >>> for component in Component.iter_from_file(f):
+        ...     component
+        VEVENT({'SUMMARY': vText(u'One')})
+        VEVENT({'SUMMARY': vText(u'Two')})
+        VCALENDAR({'PRODID': vText(u'-//test//')})
+        >>> component.subcomponents
+        []
+        """
+        return Component.iter_from_lines(Contentlines.iter_from_file(fileobj),
+                                         detach=True, lazy=lazy)
+    iter_from_file = staticmethod(iter_from_file)
 
-    def from_string(st, multiple=False):
+    def iter_from_lines(lines, detach=False, lazy=False):
         """
-        Populates the component recursively from a string
+        Generates the top level components of an iterable of unfolded content
+        lines as they end. If detach is set, their subcomponents are generated
+        on their own as they end instead of being added to them.
+
+        If lazy is set, each property keeps its text and parameters until it
+        is first read. decoded() then parses the text straight to a python
+        value, and indexing converts it to its value type as usual, so
+        properties that are never read are never parsed.
+        >>> lines = Contentlines.from_string('BEGIN:VEVENT\\r\\n'
+        ...     'DTSTART;TZID=US/Pacific:20261018T190000\\r\\n'
+        ...     'SUMMARY:Lazy\\r\\nEND:VEVENT\\r\\n')
+        >>> event = list(Component.iter_from_lines(lines, lazy=True))[0]
+        >>> sorted(event._lazy)
+        ['DTSTART', 'SUMMARY']
+        >>> event.decoded('dtstart')
+        datetime.datetime(2026, 10, 18, 19, 0)
+        >>> event['summary'], event['summary'].params
+        (vText(u'Lazy'), Parameters({}))
+        >>> event['dtstart'].params
+        Parameters({'TZID': 'US/Pacific'})
+        >>> sorted(event._lazy)
+        []
+
+        Every way of reading a property gets its value type, and a deleted
+        property is gone for decoded() too.
+        >>> lines = Contentlines.from_string('BEGIN:VEVENT\\r\\n'
+        ...     'SUMMARY:Hi\\r\\nLOCATION:Deck\\r\\nURL:http://example.com\\r\\n'
+        ...     'COMMENT:One\\r\\nCOMMENT:Two\\r\\nEND:VEVENT\\r\\n')
+        >>> lazy, eager = [list(Component.iter_from_lines(lines, lazy=l))[0]
+        ...                for l in (True, False)]
+        >>> lazy == eager, lazy != eager
+        (True, False)
+        >>> lazy = list(Component.iter_from_lines(lines, lazy=True))[0]
+        >>> lazy.pop('summary'), lazy.setdefault('location'), lazy.copy()['url']
+        (vText(u'Hi'), vText(u'Deck'), 'http://example.com')
+        >>> sorted(lazy.iteritems())
+        [('COMMENT', [vText(u'One'), vText(u'Two')]), ('LOCATION', vText(u'Deck')), ('URL', 'http://example.com')]
+        >>> del lazy['url']
+        >>> lazy.decoded('url', 'No url')
+        'No url'
+
+        Parameters are parsed as strictly as the line they were read from.
+        >>> lines = [Contentline(l, strict=True) for l in
+        ...          ('BEGIN:VEVENT', 'ATTENDEE;ROLE=chair:MAILTO:a@example.com', 'END:VEVENT')]
+        >>> list(Component.iter_from_lines(lines, lazy=True))[0]['attendee'].params
+        Parameters({'ROLE': 'CHAIR'})
         """
         stack = [] # a stack of components
-        comps = []
-        for line in Contentlines.from_string(st): # raw parsing
+        for line in lines:
             if not line:
                 continue
-            name, params, vals = line.parts()
+            name, params, vals = line.raw_parts()
             uname = name.upper()
             # check for start of component
             if uname == 'BEGIN':
@@ -359,25 +590,24 @@ class Component(CaselessDict):
                 # so pop it from the stack and add it to the new top.
                 component = stack.pop()
                 if not stack: # we are at the end
-                    comps.append(component)
+                    yield component
+                elif detach and len(stack) == 1:
+                    yield component
                 else:
                     stack[-1].add_component(component)
             # we are adding properties to the current top of the stack
+            elif lazy:
+                stack[-1]._add_lazy(name, LazyProperty(params, vals, line.strict))
             else:
                 factory = types_factory.for_property(name)
                 vals = factory(factory.from_ical(vals))
-                vals.params = params
+                vals.params = Parameters.from_items(params, strict=line.strict)
                 stack[-1].add(name, vals, encode=0)
-        if multiple:
-            return comps
-        if not len(comps) == 1:
-            raise ValueError('Found multiple components where '
-                             'only one is allowed')
-        return comps[0]
-    from_string = staticmethod(from_string)
+    iter_from_lines = staticmethod(iter_from_lines)
 
 
     def __repr__(self):
+        self._resolve_all()
         return '%s(' % self.name + dict.__repr__(self) + ')'
 
 #    def content_line(self, name):
@@ -396,8 +626,21 @@ class Component(CaselessDict):
         return contentlines
 
 
+    def iter_lines(self):
+        "Generates the folded content lines of the component, CRLF included"
+        for name, values in self.iter_property_items():
+            params = getattr(values, 'params', Parameters())
+            yield str(Contentline.from_parts((name, params, values))) + '\r\n'
+
+
+    def write_to(self, fileobj):
+        "Writes the rendered iCalendar to fileobj as it is generated"
+        for line in self.iter_lines():
+            fileobj.write(line)
+
+
     def as_string(self):
-        return str(self.content_lines())
+        return ''.join(self.iter_lines())
 
 
     def __str__(self):
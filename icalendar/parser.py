@@ -35,6 +35,17 @@ UNSAFE_CHAR = re.compile('[\x00-\x08\x0a-\x1f\x7F",:;]')
 QUNSAFE_CHAR = re.compile('[\x00-\x08\x0a-\x1f\x7F"]')
 FOLD = re.compile('([\r]?\n)+[ \t]{1}')
 
+# Tokenizer for content lines. A parameter value is a quoted string or a run
+# of characters that pass validate_param_value, so matching a whole line
+# against CONTENT_LINE validates it and finds its split points in one scan.
+QVALUE = '"[^\x00-\x08\x0a-\x1f\x7F"]*"'
+PVALUE = '(?:%s|[^\x00-\x08\x0a-\x1f\x7F",:;=]*)' % QVALUE
+PARAM = '[\w-]+=%s(?:,%s)*' % (PVALUE, PVALUE)
+PARAM_VALUE = re.compile(PVALUE)
+PARAM_ITEM = re.compile('([\w-]+)=(%s(?:,%s)*)' % (PVALUE, PVALUE))
+PARAMS = re.compile('%s(?:;%s)*\Z' % (PARAM, PARAM))
+CONTENT_LINE = re.compile('([\w-]+)((?:;%s)*):' % PARAM)
+
 def validate_token(name):
     match = NAME.findall(name)
     if len(match) == 1 and name == match[0]:
@@ -205,43 +216,59 @@ class Parameters(CaselessDict):
 
     def from_string(st, strict=False):
         "Parses the parameter format from ical text format"
-        try:
-            # parse into strings
-            result = Parameters()
-            for param in q_split(st, ';'):
-                key, val =  q_split(param, '=')
-                validate_token(key)
-                param_values = [v for v in q_split(val, ',')]
-                # Property parameter values that are not in quoted
-                # strings are case insensitive.
-                vals = []
-                for v in param_values:
-                    if v.startswith('"') and v.endswith('"'):
-                        v = v.strip('"')
-                        validate_param_value(v, quoted=True)
-                        vals.append(v)
-                    else:
-                        validate_param_value(v, quoted=False)
-                        if strict:
-                            vals.append(v.upper())
-                        else:
-                            vals.append(v)
-                if not vals:
-                    result[key] = val
-                else:
-                    if len(vals) == 1:
-                        result[key] = vals[0]
-                    else:
-                        result[key] = vals
-            return result
-        except:
+        if st and not PARAMS.match(st):
             raise ValueError, 'Not a valid parameter string'
+        return Parameters.from_items(st, strict)
+
+    def from_items(st, strict=False):
+        """
+        Builds Parameters from a string already matched by PARAMS, or the
+        parameters of a CONTENT_LINE match. Property parameter values that are
+        not in quoted strings are case insensitive, and upper cased if strict.
+        >>> Parameters.from_items(';MEMBER="a,b",c;Role=chair', strict=True)
+        Parameters({'MEMBER': ['a,b', 'C'], 'ROLE': 'CHAIR'})
+        """
+        result = Parameters()
+        for match in PARAM_ITEM.finditer(st):
+            key, val = match.groups()
+            vals = []
+            pos = 0
+            while pos <= len(val):
+                v = PARAM_VALUE.match(val, pos).group()
+                pos += len(v) + 1
+                if v.startswith('"'):
+                    vals.append(v[1:-1])
+                elif strict:
+                    vals.append(v.upper())
+                else:
+                    vals.append(v)
+            if len(vals) == 1:
+                result[key] = vals[0]
+            else:
+                result[key] = vals
+        return result
+    from_items = staticmethod(from_items)
+
     from_string = staticmethod(from_string)
 
 
 #########################################
 # parsing and generation of content lines
 
+CONTINUATION_BYTE = re.compile('[\x80-\xbf]')
+# up to 74 bytes that are not followed by the rest of a UTF-8 character
+FOLD_PIECE = re.compile('.{1,74}(?![\x80-\xbf])', re.S)
+
+def fold_utf8(line):
+    """
+    Folds line into pieces of at most 74 bytes without splitting a UTF-8
+    character. See http://lists.osafoundation.org/pipermail/ietf-calsify/2006-August/001126.html
+    >>> fold_utf8('x' * 73 + '\\xc3\\xab' + 'x').split('\\r\\n ')[1]
+    '\\xc3\\xabx'
+    """
+    return '\r\n '.join(FOLD_PIECE.findall(line))
+
+
 class Contentline(str):
     """
     A content line is basically a string that can be folded and parsed into
@@ -387,31 +414,21 @@ class Contentline(str):
     def parts(self):
         """ Splits the content line up into (name, parameters, values) parts
         """
-        try:
-            name_split = None
-            value_split = None
-            inquotes = 0
-            for i in range(len(self)):
-                ch = self[i]
-                if not inquotes:
-                    if ch in ':;' and not name_split:
-                        name_split = i
-                    if ch == ':' and not value_split:
-                        value_split = i
-                if ch == '"':
-                    inquotes = not inquotes
-            name = self[:name_split]
-            if not name:
-                raise ValueError, 'Key name is required'
-            validate_token(name)
-            if name_split+1 == value_split:
-                raise ValueError, 'Invalid content line'
-            params = Parameters.from_string(self[name_split+1:value_split],
-                                            strict=self.strict)
-            values = self[value_split+1:]
-            return (name, params, values)
-        except:
+        name, params, values = self.raw_parts()
+        return (name, Parameters.from_items(params, strict=self.strict), values)
+
+    def raw_parts(self):
+        """
+        Splits the content line up like parts(), leaving the parameters as the
+        string they were written as.
+        >>> Contentline('key;param=pvalue;p2="a:b":value').raw_parts()
+        ('key', ';param=pvalue;p2="a:b"', 'value')
+        """
+        match = CONTENT_LINE.match(self)
+        if not match:
             raise ValueError, 'Content line could not be parsed into parts'
+        name, params = match.groups()
+        return (name, params, self[match.end():])
 
     def from_string(st, strict=False):
         "Unfolds the content lines in an iCalendar into long content lines"
@@ -424,40 +441,21 @@ class Contentline(str):
 
     def __str__(self):
         "Long content lines are folded so they are less than 75 characters wide"
-        l_line = len(self)
-        new_lines = []
-        start = 0
-        end = 74
-        while True:
-            if end >= l_line:
-                end = l_line
-            else:
-                # Check that we don't fold in the middle of a UTF-8 character:
-                # http://lists.osafoundation.org/pipermail/ietf-calsify/2006-August/001126.html
-                while True:
-                    char_value = ord(self[end])
-                    if char_value < 128 or char_value >= 192:
-                        # This is not in the middle of a UTF-8 character, so we
-                        # can fold here:
-                        break
-                    else:
-                        end -= 1
-
-            new_lines.append(self[start:end])
-            if end == l_line:
-                # Done
-                break
-            start = end
-            end = start + 74
-        return '\r\n '.join(new_lines)
+        if len(self) <= 74:
+            return self[:]
+        # Only a fold that would land inside a UTF-8 character needs the
+        # scan, anything else, like all ASCII, is cut into even slices
+        if CONTINUATION_BYTE.search(self[74::74]):
+            return fold_utf8(self)
+        return '\r\n '.join([self[i:i + 74] for i in xrange(0, len(self), 74)])
 
 
 
 class Contentlines(list):
     """
     I assume that iCalendar files generally are a few kilobytes in size. Then
-    this should be efficient. for Huge files, an iterator should probably be
-    used instead.
+    this should be efficient. For huge files, iter_from_file reads the content
+    lines one at a time instead.
 
     >>> c = Contentlines([Contentline('BEGIN:VEVENT\\r\\n')])
     >>> str(c)
@@ -494,6 +492,30 @@ class Contentlines(list):
             raise ValueError, 'Expected StringType with content lines'
     from_string = staticmethod(from_string)
 
+    def iter_from_file(fileobj):
+        """
+        Generates the content lines of a file object, unfolding them as they
+        are read, so a huge file never has to be in memory at once.
+        >>> from StringIO import StringIO
+        >>> f = StringIO('A faked\\r\\n  long line\\r\\n\\r\\nAnd another lin\\n\\te that is folded')
+        >>> list(Contentlines.iter_from_file(f))
+        ['A faked long line', 'And another line that is folded']
+        """
+        line = None
+        for physical in fileobj:
+            physical = physical.rstrip('\r\n')
+            if not physical:
+                continue
+            if line is not None and physical[0] in ' \t':
+                line += physical[1:]
+            else:
+                if line is not None:
+                    yield Contentline(line)
+                line = physical
+        if line is not None:
+            yield Contentline(line)
+    iter_from_file = staticmethod(iter_from_file)
+
 
 # ran this:
 #    sample = open('./samples/test.ics', 'rb').read() # binary file in windows!
@@ -0,0 +1,50 @@
+"""Micro-benchmark for content line folding.
+
+Times Contentline.__str__ against fold_scan, the byte scanning loop it used
+to run for every line, on a short line, on an ASCII description of the size
+the event exports write and on a description with UTF-8 text in it. Run
+from the top directory:
+
+    python -m icalendar.tests.fold_benchmark
+"""
+import timeit
+from icalendar.parser import Contentline
+
+SHORT_LINE = Contentline('DTSTART;TZID=US/Pacific:20261018T190000')
+ASCII_LINE = Contentline('DESCRIPTION:' + 'Status: approved\\nType: Meetup\\nRooms: Deck and Savanna\\n' * 10)
+UTF8_LINE = Contentline('DESCRIPTION:' + 'Caf\xc3\xa9 night at the Dojo \xe2\x98\x83\\n' * 20)
+NUMBER = 20000
+
+def fold_scan(line):
+    "The previous Contentline.__str__"
+    l_line = len(line)
+    new_lines = []
+    start = 0
+    end = 74
+    while True:
+        if end >= l_line:
+            end = l_line
+        else:
+            while True:
+                char_value = ord(line[end])
+                if char_value < 128 or char_value >= 192:
+                    break
+                else:
+                    end -= 1
+        new_lines.append(line[start:end])
+        if end == l_line:
+            break
+        start = end
+        end = start + 74
+    return '\r\n '.join(new_lines)
+
+def main():
+    for label, line in [('short', SHORT_LINE), ('ascii', ASCII_LINE), ('utf-8', UTF8_LINE)]:
+        assert str(line) == fold_scan(line)
+        scan = min(timeit.repeat(lambda: fold_scan(line), number=NUMBER, repeat=5))
+        fold = min(timeit.repeat(lambda: Contentline.__str__(line), number=NUMBER, repeat=5))
+        print '%-6s %4d bytes  scan %.3fs  Contentline %.3fs  %.1fx' % (
+            label, len(line), scan, fold, scan / fold)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Reading partner calendars for the bulk import.
+
+Turns the VEVENTs of an iCalendar file into the fields of an Event. Nothing
+in here talks to App Engine, so it can be exercised directly by the tests.
+"""
+from datetime import datetime, timedelta
+import re
+import pytz
+
+from icalendar.cal import Component
+
+LOCATION_SEPARATOR = re.compile(r'\s*(?:,|;|\band\b|&)\s*', re.I)
+
+def local_time(value, tz, tzid=None):
+    """Return the naive local time of a DTSTART or DTEND value in tz.
+
+    A time with a TZID parameter is in the zone tzid names. Floating times
+    are taken as local already, and a date as its midnight.
+    """
+    if not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if not value.tzinfo and tzid:
+        try:
+            value = pytz.timezone(tzid).localize(value)
+        except pytz.UnknownTimeZoneError:
+            raise ValueError('Unknown time zone %s' % tzid)
+    if value.tzinfo:
+        return value.astimezone(tz).replace(tzinfo=None)
+    return value
+
+def rooms_in(location, room_names):
+    """Return the rooms of room_names named in a LOCATION, in their order."""
+    named = [part.lower() for part in LOCATION_SEPARATOR.split(location or '')]
+    return [name for name in room_names if name.lower() in named]
+
+def vevent_fields(vevent, tz, room_names):
+    """Return the Event fields of vevent.
+
+    Raises ValueError if the VEVENT cannot be imported as one event.
+    """
+    if not vevent.get('summary'):
+        raise ValueError('No summary')
+    if not vevent.get('dtstart'):
+        raise ValueError('No start time')
+    if vevent.get('rrule') or vevent.get('rdate'):
+        raise ValueError('Recurring events are not imported')
+    start = vevent.decoded('dtstart')
+    # the bundled value types leave the TZID parameter to the caller
+    start_tzid = end_tzid = vevent['dtstart'].params.get('tzid')
+    if vevent.get('dtend'):
+        end = vevent.decoded('dtend')
+        end_tzid = vevent['dtend'].params.get('tzid')
+    elif vevent.get('duration'):
+        end = start + vevent.decoded('duration')
+    elif isinstance(start, datetime):
+        end = start
+    else:
+        # an all day event
+        end = start + timedelta(days=1)
+    start_time, end_time = local_time(start, tz, start_tzid), local_time(end, tz, end_tzid)
+    if end_time < start_time:
+        raise ValueError('End time must be after start time')
+    return {
+        'name': vevent.decoded('summary'),
+        'start_time': start_time,
+        'end_time': end_time,
+        'details': vevent.decoded('description', u''),
+        'url': vevent.decoded('url', u''),
+        'rooms': rooms_in(vevent.decoded('location', u''), room_names),
+    }
+
+def parse_vevents(fileobj, tz, room_names):
+    """Generate (uid, fields, error) for each VEVENT in an iCalendar file.
+
+    Args:
+        fileobj: file like object holding the calendar, read incrementally.
+        tz: pytz timezone the times are converted to.
+        room_names: names of the bookable rooms LOCATION is matched against.
+
+    fields is None and error a message for VEVENTs that cannot be imported.
+    """
+    # only a handful of properties are read, so the rest are never parsed
+    for component in Component.iter_from_file(fileobj, lazy=True):
+        if component.name != 'VEVENT':
+            continue
+        uid = component.get('uid', '')
+        try:
+            yield uid, vevent_fields(component, tz, room_names), None
+        except ValueError, e:
+            yield uid, None, str(e)
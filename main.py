@@ -2,26 +2,90 @@ import cgi
 from google.appengine.ext import webapp, db
 from google.appengine.ext.webapp import util, template
 from google.appengine.api import urlfetch, memcache, users, mail
+from google.appengine.ext import deferred
 
 from django.utils import simplejson
 from django.template.defaultfilters import slugify
-from icalendar import Calendar, Event as CalendarEvent
-import logging, urllib, os
+from icalendar import Calendar, FreeBusy
+import logging, urllib, os, hashlib
+from email.utils import parsedate
+from StringIO import StringIO
 from pprint import pprint
 from datetime import datetime, timedelta
 
-from models import Event, Feedback, HDLog, ROOM_OPTIONS, PENDING_LIFETIME
-from utils import username, human_username, set_cookie, local_today, is_phone_valid, UserRights, dojo
+from models import Event, Feedback, HDLog, ROOM_OPTIONS, ROOMS, PENDING_LIFETIME, \
+    QUERY_FILTERS, QUERY_PAGE_SIZE, QUERY_MAX_PAGE_SIZE, FEED_MAX_LIMIT
+from utils import event_path, username, human_username, set_cookie, local_today, is_phone_valid, to_sentence_list, UserRights, dojo, LOCAL_TZ
 from notices import *
+import migrations
+import export
+import importer
+import schedule
 
-import PyRSS2Gen
-import re
 import pytz
 
 webapp.template.register_template_library('templatefilters')
 
-def event_path(event):
-    return '/event/%s-%s' % (event.key().id(), slugify(event.name))
+HTTP_DATE = '%a, %d %b %Y %H:%M:%S GMT'
+FREEBUSY_DAYS = 7
+FREEBUSY_MAX_DAYS = 31
+# Members sign in with accounts on this domain, named after their nick
+MEMBER_DOMAIN = 'hackerdojo.com'
+
+def feed_validators(request, *parts):
+    """Return (etag, last_modified) for a response that depends only on
+    the calendar version, the local day and parts.
+
+    Both are computed without touching the datastore as long as the
+    calendar version is in memcache.
+    """
+    version = Event.calendar_version()
+    today = local_today()
+    etag = '"%s"' % hashlib.md5('|'.join(map(str,
+        parts + (request.headers.get('host'), today.date(), version)))).hexdigest()
+    # the feed windows move at local midnight even if no event changed
+    midnight = pytz.timezone(LOCAL_TZ).localize(today).astimezone(pytz.utc)
+    return etag, max(version, midnight.replace(tzinfo=None))
+
+def not_modified(request, etag, last_modified):
+    """Does the client already hold the response identified by etag?"""
+    if 'If-None-Match' in request.headers:
+        return etag in [t.strip() for t in request.headers['If-None-Match'].split(',')] \
+            or request.headers['If-None-Match'].strip() == '*'
+    since = parsedate(request.headers.get('If-Modified-Since', ''))
+    return bool(since) and datetime(*since[:6]) >= last_modified.replace(microsecond=0)
+
+def feed_window(request):
+    """Return the (start, end, limit) a feed request asks for.
+
+    Without parameters this is Event.feed_window(). Giving a start or end
+    date raises the limit to FEED_MAX_LIMIT, which no limit given can
+    exceed. Longer windows are paged through with the cursor of the next
+    link. Raises ValueError on malformed parameters.
+    """
+    start, end, limit = Event.feed_window()
+    if request.get('start'):
+        start = datetime.strptime(request.get('start'), '%Y-%m-%d')
+        limit = FEED_MAX_LIMIT
+    if request.get('end'):
+        end = datetime.strptime(request.get('end'), '%Y-%m-%d')
+        limit = FEED_MAX_LIMIT
+    if request.get('limit'):
+        limit = min(int(request.get('limit')), FEED_MAX_LIMIT)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    return start, end, limit
+
+def conflict_error(rooms):
+    note = ROOMS.shared_space_note(rooms)
+    if note:
+        return ValueError('Room conflict detected <small>(Note: %s)</small>' % cgi.escape(note))
+    return ValueError('Room conflict detected')
+
+def slot_suggestions(start_time, end_time, rooms, existing_event_id=0):
+    return [{'start': start, 'end': end, 'rooms': to_sentence_list(slot_rooms)}
+            for start, end, slot_rooms in Event.suggest_free_slots(
+                start_time, end_time, rooms, existing_event_id)]
 
 class DomainCacheCron(webapp.RequestHandler):
     def post(self):        
@@ -34,7 +98,7 @@ class ReminderCron(webapp.RequestHandler):
         today = local_today()
         # remind everyone 3 days in advance they need to show up
         events = Event.all() \
-            .filter('status IN', ['approved']) \
+            .filter('status =', 'approved') \
             .filter('reminded =', False) \
             .filter('start_time <', today + timedelta(days=3))
         for event in events:   
@@ -51,7 +115,7 @@ class ExpireCron(webapp.RequestHandler):
         # Expire events marked to expire today
         today = local_today()
         events = Event.all() \
-            .filter('status IN', ['pending', 'understaffed']) \
+            .filter('expirable =', True) \
             .filter('expired >=', today) \
             .filter('expired <', today + timedelta(days=1))
         for event in events:
@@ -64,112 +128,192 @@ class ExpireReminderCron(webapp.RequestHandler):
         # Find events expiring in 10 days to warn owner
         ten_days = local_today() + timedelta(days=10)
         events = Event.all() \
-            .filter('status IN', ['pending', 'understaffed']) \
+            .filter('expirable =', True) \
             .filter('expired >=', ten_days) \
             .filter('expired <', ten_days + timedelta(days=1))
         for event in events:
             notify_owner_expiring(event)
 
 class ExportHandler(webapp.RequestHandler):
+    # Every format renders the same cached export records, see export.py.
     def get(self, format):
-        content_type, body = getattr(self, 'export_%s' % format)()
+        self.export(format)
+
+    def export(self, format, filters={}):
+        """Write the feed of format, narrowed down by the Event.iter_feed
+        filters."""
+        formatter = export.FORMATTERS.get(format)
+        if not formatter:
+            self.error(404)
+            return
+        try:
+            start, end, limit = feed_window(self.request)
+        except ValueError:
+            self.error(400)
+            return
+        # each window gets its own validators, and 304s skip the datastore.
+        # The etag also keys the cached body, see export.cached_body.
+        etag, last_modified = feed_validators(self.request, self.request.path,
+                                              start, end, limit, self.request.query_string)
+        gzipped = export.accepts_gzip(self.request)
+        if gzipped:
+            # the gzipped body is a different entity, so it needs its own
+            # strong validator
+            etag = etag[:-1] + '-gzip"'
+        self.response.headers['ETag'] = etag
+        self.response.headers['Last-Modified'] = last_modified.strftime(HTTP_DATE)
+        self.response.headers['Vary'] = 'Accept-Encoding'
+        if not_modified(self.request, etag, last_modified):
+            self.response.set_status(304)
+            return
+        page = {}
+        def render():
+            events = Event.iter_feed(start, end, limit, formatter.large_only, filters,
+                                     self.request.get('cursor') or None, page)
+            url_base = 'http://' + self.request.headers.get('host', 'events.hackerdojo.com')
+            return formatter.render(export.iter_records(events), url_base, self.request.GET)
+        self.response.headers['content-type'] = formatter.content_type
+        if gzipped:
+            self.response.headers['Content-Encoding'] = 'gzip'
+        try:
+            for chunk in export.cached_body(etag, render, gzipped, page):
+                self.response.out.write(chunk)
+        except (db.BadValueError, db.BadRequestError):
+            # a malformed cursor, or one from another feed
+            del self.response.headers['Content-Encoding']
+            self.error(400)
+            return
+        if page.get('cursor'):
+            params = [(k, v.encode('utf-8')) for k, v in self.request.GET.items()
+                      if k != 'cursor'] + [('cursor', page['cursor'])]
+            self.response.headers['Link'] = '<%s?%s>; rel="next"' % (
+                self.request.path_url, urllib.urlencode(params))
+
+
+class MemberExportHandler(ExportHandler):
+    # A member's own events, for personal calendar subscriptions
+    def get(self, nick, format):
+        nick = urllib.unquote(nick)
+        if '@' not in nick:
+            nick = '%s@%s' % (nick, MEMBER_DOMAIN)
+        self.export(format, {'member': users.User(nick)})
+
+
+class RoomExportHandler(ExportHandler):
+    def get(self, room, format):
+        room = urllib.unquote(room)
+        if room not in ROOMS.bits:
+            self.error(404)
+            return
+        self.export(format, {'room': room})
+
+
+class EventQueryHandler(webapp.RequestHandler):
+    # Pages through Event.query_page. Takes the QUERY_FILTERS as parameters,
+    # a start/end date window, limit, cursor, and fields= to pick which of
+    # the /events.json fields are returned.
+    def get(self):
+        filters = {}
+        for name in QUERY_FILTERS:
+            value = self.request.get(name)
+            if value:
+                filters[name] = users.User(value) if name == 'member' else value
+        formatter = export.FORMATTERS['json']
+        fields = [f for f in self.request.get('fields').split(',') if f]
+        try:
+            start = end = None
+            if self.request.get('start'):
+                start = datetime.strptime(self.request.get('start'), '%Y-%m-%d')
+            if self.request.get('end'):
+                end = datetime.strptime(self.request.get('end'), '%Y-%m-%d')
+            limit = min(int(self.request.get('limit') or QUERY_PAGE_SIZE), QUERY_MAX_PAGE_SIZE)
+            if limit < 1 or [f for f in fields if f not in formatter.FIELDS]:
+                raise ValueError
+            events, cursor = Event.query_page(filters, start, end,
+                                              self.request.get('cursor') or None, limit)
+        except (ValueError, db.BadValueError, db.BadRequestError):
+            self.error(400)
+            return
+        events = map(formatter.summarize, export.export_records(events))
+        if fields:
+            events = [dict((f, e[f]) for f in fields if f in e) for e in events]
+        self.response.headers['content-type'] = formatter.content_type
+        self.response.out.write(simplejson.dumps({'events': events, 'cursor': cursor}))
+
+
+class HistoryExportHandler(webapp.RequestHandler):
+    # Admins only, see app.yaml. Pass the last cursor line back as
+    # ?cursor= to resume, see export.iter_history.
+    def get(self):
+        lines = export.iter_history(self.request.get('cursor') or None)
+        try:
+            first = lines.next()
+        except (db.BadValueError, db.BadRequestError):
+            self.error(400)
+            return
+        self.response.headers['content-type'] = 'application/x-ndjson'
+        self.response.out.write(first)
+        for line in lines:
+            self.response.out.write(line)
+
+
+class FreeBusyHandler(webapp.RequestHandler):
+    def get(self, room, format):
+        room = urllib.unquote(room)
+        if room not in ROOMS.bits:
+            self.error(404)
+            return
+        try:
+            start = local_today()
+            if self.request.get('start'):
+                start = datetime.strptime(self.request.get('start'), '%Y-%m-%d')
+            end = start + timedelta(days=FREEBUSY_DAYS)
+            if self.request.get('end'):
+                end = datetime.strptime(self.request.get('end'), '%Y-%m-%d')
+        except ValueError:
+            self.error(400)
+            return
+        end = min(end, start + timedelta(days=FREEBUSY_MAX_DAYS))
+        busy = Event.busy_periods(room, start, end)
+        content_type, chunks = getattr(self, 'export_%s' % format)(room, start, end, busy)
         self.response.headers['content-type'] = content_type
-        self.response.out.write(body)
-        
-    def export_json(self):
-        events = Event.get_recent_past_and_future()
-        for k in self.request.GET:
-            if self.request.GET[k] and k in ['member']:
-                value = users.User(urllib.unquote(self.request.GET[k]))
-            else:
-                value = urllib.unquote(self.request.GET[k])
-            events = events.filter('%s =' % k, value)
-        events = map(lambda x: x.to_dict(summarize=True), events)
-        return 'application/json', simplejson.dumps(events)
-    
-    def export_ics(self):
-        events = Event.get_recent_past_and_future()
-        url_base = 'http://' + self.request.headers.get('host', 'events.hackerdojo.com')
+        for chunk in chunks:
+            self.response.out.write(chunk)
+
+    def export_json(self, room, start, end, busy):
+        fmt = '%Y-%m-%dT%H:%M:%S'
+        return 'application/json', [simplejson.dumps({
+            'room': room,
+            'start': start.strftime(fmt),
+            'end': end.strftime(fmt),
+            'busy': [{'start': s.strftime(fmt), 'end': e.strftime(fmt)} for s, e in busy]})]
+
+    def export_ics(self, room, start, end, busy):
+        host = self.request.headers.get('host', 'events.hackerdojo.com')
+        tz = pytz.timezone(LOCAL_TZ)
+        # vDatetime applies the offset in force now, so times are given in
+        # UTC, converted with the offset in force at each of them
+        utc = lambda t: tz.localize(t).astimezone(pytz.utc)
         cal = Calendar()
-        for event in events:
-            iev = CalendarEvent()
-            iev.add('summary', event.name if event.status == 'approved' else event.name + ' (%s)' % event.status.upper())
-            # make verbose description with empty fields where information is missing
-            ev_desc = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
-                event.status, 
-                event.owner(), 
-                event.type, 
-                event.estimated_size, 
-                event.url, 
-                event.fee, 
-                event.contact_name, 
-                event.contact_phone, 
-                event.roomlist(), 
-                event.details, 
-                event.notes)
-            # then delete the empty fields with a regex
-            ev_desc = re.sub(re.compile(r'^__.*?:[ ,]*$\n*',re.M),'',ev_desc)
-            ev_desc = re.sub(re.compile(r'^__',re.M),'',ev_desc)
-            ev_url = url_base + event_path(event)
-            iev.add('description', ev_desc + '\n--\n' + ev_url)
-            iev.add('url', ev_url)
-            if event.start_time:
-              iev.add('dtstart', event.start_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            if event.end_time:
-              iev.add('dtend', event.end_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            cal.add_component(iev)
-        return 'text/calendar', cal.as_string()
-
-    def export_large_ics(self):
-        events = Event.get_recent_past_and_future()
-        url_base = 'http://' + self.request.headers.get('host', 'events.hackerdojo.com')
-        cal = Calendar()
-        for event in events:
-            iev = CalendarEvent()
-            iev.add('summary', event.name + ' (%s)' % event.estimated_size)
-            # make verbose description with empty fields where information is missing
-            ev_desc = '__Status: %s\n__Member: %s\n__Type: %s\n__Estimated size: %s\n__Info URL: %s\n__Fee: %s\n__Contact: %s, %s\n__Rooms: %s\n\n__Details: %s\n\n__Notes: %s' % (
-                event.status, 
-                event.owner(), 
-                event.type, 
-                event.estimated_size, 
-                event.url, 
-                event.fee, 
-                event.contact_name, 
-                event.contact_phone, 
-                event.roomlist(), 
-                event.details, 
-                event.notes)
-            # then delete the empty fields with a regex
-            ev_desc = re.sub(re.compile(r'^__.*?:[ ,]*$\n*',re.M),'',ev_desc)
-            ev_desc = re.sub(re.compile(r'^__',re.M),'',ev_desc)
-            ev_url = url_base + event_path(event)
-            iev.add('description', ev_desc + '\n--\n' + ev_url)
-            iev.add('url', ev_url)
-            if event.start_time:
-              iev.add('dtstart', event.start_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            if event.end_time:
-              iev.add('dtend', event.end_time.replace(tzinfo=pytz.timezone('US/Pacific')))
-            cal.add_component(iev)
-        return 'text/calendar', cal.as_string()
-    
-    def export_rss(self):
-        url_base = 'http://' + self.request.headers.get('host', 'events.hackerdojo.com')
-        events = Event.get_recent_past_and_future()
-        rss = PyRSS2Gen.RSS2(
-            title = "Hacker Dojo Events Feed",
-            link = url_base,
-            description = "Upcoming events at the Hacker Dojo in Mountain View, CA",
-            lastBuildDate = datetime.now(),
-            items = [PyRSS2Gen.RSSItem(
-                        title = event.name,
-                        link = url_base + event_path(event),
-                        description = event.details,
-                        guid = url_base + event_path(event),
-                        pubDate = event.updated,
-                        ) for event in events]
-        )
-        return 'application/xml', rss.to_xml()
+        fb = FreeBusy()
+        fb.add('uid', '%s-%s@%s' % (slugify(room), start.strftime('%Y%m%d'), host))
+        fb.add('dtstamp', datetime.now(pytz.utc))
+        fb.add('dtstart', utc(start))
+        fb.add('dtend', utc(end))
+        fb.add('comment', room)
+        for s, e in busy:
+            fb.add('freebusy', (utc(s), utc(e)))
+        cal.add_component(fb)
+        return 'text/calendar', cal.iter_lines()
+
+
+class MigrationHandler(webapp.RequestHandler):
+    def get(self, name):
+        if name not in migrations.MIGRATIONS:
+            self.error(404)
+            return
+        deferred.defer(migrations.MIGRATIONS[name])
+        self.response.out.write('Started migration %s' % name)
 
 
 class EditHandler(webapp.RequestHandler):
@@ -204,10 +348,8 @@ class EditHandler(webapp.RequestHandler):
                     self.request.get('end_time_ampm')), '%m/%d/%Y %I:%M %p')
                 conflicts = Event.check_conflict(start_time,end_time,self.request.get_all('rooms'), int(id))
                 if conflicts:
-                    if "Deck" in self.request.get_all('rooms') or "Savanna" in self.request.get_all('rooms'):
-                        raise ValueError('Room conflict detected <small>(Note: Deck &amp; Savanna share the same area, two events cannot take place at the same time in these rooms.)</small>')
-                    else:
-                        raise ValueError('Room conflict detected')
+                    suggestions = slot_suggestions(start_time, end_time, self.request.get_all('rooms'), int(id))
+                    raise conflict_error(self.request.get_all('rooms'))
                 if not self.request.get('estimated_size').isdigit():
                     raise ValueError('Estimated number of people must be a number')
                 if not int(self.request.get('estimated_size')) > 0:
@@ -253,6 +395,8 @@ class EditHandler(webapp.RequestHandler):
                       log_desc = log_desc + "<strong>Old room:</strong> " + previous_object.roomlist() + "<br />"
                       log_desc = log_desc + "<strong>New room:</strong> " + event.roomlist() + "<br />"
                     event.put()
+                    event.flush_cached_lists()
+                    previous_object.flush_cached_lists()
                     log = HDLog(event=event,description=log_desc)
                     log.put()
                     self.redirect(event_path(event))
@@ -335,7 +479,7 @@ class ApprovedHandler(webapp.RequestHandler):
             login_url = users.create_login_url('/')
         today = local_today()
         show_all_nav = user
-        events = Event.get_approved_list()
+        events = Event.cached_list('approved')
         tomorrow = today + timedelta(days=1)
         whichbase = 'base.html'
         if self.request.get('base'):
@@ -358,8 +502,121 @@ class MyEventsHandler(webapp.RequestHandler):
         self.response.out.write(template.render('templates/myevents.html', locals()))
 
 
-class PastHandler(webapp.RequestHandler):
+class ImportHandler(webapp.RequestHandler):
+    # Admins only, see app.yaml
     def get(self):
+        user = users.get_current_user()
+        logout_url = users.create_logout_url('/')
+        show_all_nav = user
+        self.response.out.write(template.render('templates/import.html', locals()))
+
+    def post(self):
+        user = users.get_current_user()
+        logout_url = users.create_logout_url('/')
+        show_all_nav = user
+        try:
+            upload = self.request.POST.get('file')
+            if hasattr(upload, 'file'):
+                source = upload.filename
+                calendar = upload.file
+            elif self.request.get('url'):
+                source = self.request.get('url')
+                calendar = StringIO(urlfetch.fetch(source).content)
+            else:
+                raise ValueError('An iCalendar file or URL is required')
+            if not self.request.get('type'):
+                raise ValueError('Category is required')
+            if not self.request.get('estimated_size').isdigit():
+                raise ValueError('Estimated number of people must be a number')
+            if not int(self.request.get('estimated_size')) > 0:
+                raise ValueError('Estimated number of people must be greater then zero')
+            status = self.request.get('status', 'pending')
+            if status not in ['pending', 'approved']:
+                raise ValueError('Events can only be imported as pending or approved')
+            skipped = []
+            proposed = []
+            uids = set()
+            for uid, fields, error in importer.parse_vevents(
+                    calendar, pytz.timezone(LOCAL_TZ), ROOMS.names):
+                if error:
+                    skipped.append({'uid': uid, 'name': '', 'reason': error})
+                elif uid and uid in uids:
+                    skipped.append({'uid': uid, 'name': fields['name'],
+                                    'reason': 'Repeats the UID of another event in the calendar'})
+                else:
+                    uids.add(uid)
+                    proposed.append((uid, fields))
+        except (ValueError, urlfetch.Error), e:
+            error = str(e)
+            self.response.out.write(template.render('templates/error.html', locals()))
+            return
+        # events imported before under the same UID are updated in place
+        previous = Event.get_imported([uid for uid, f in proposed if uid])
+        # check the whole batch against the calendar, then what is left of
+        # it against itself
+        existing = Event.check_conflicts_bulk([(f['start_time'], f['end_time'], f['rooms'])
+                                               for uid, f in proposed])
+        for i, (uid, f) in enumerate(proposed):
+            if uid in previous:
+                existing[i] = [e for e in existing[i] if e.key() != previous[uid].key()]
+        free = [i for i, conflicts in enumerate(existing) if not conflicts]
+        clashes = schedule.sweep_conflicts([(proposed[i][1]['start_time'], proposed[i][1]['end_time'],
+                                             ROOMS.mask(proposed[i][1]['rooms']),
+                                             ROOMS.closure_mask(proposed[i][1]['rooms']))
+                                            for i in free])
+        clashes = set([free[j] for j in clashes])
+        imported = []
+        updated = []
+        for i, (uid, fields) in enumerate(proposed):
+            values = {
+                'name': cgi.escape(fields['name']),
+                'start_time': fields['start_time'],
+                'end_time': fields['end_time'],
+                'details': cgi.escape(fields['details']),
+                'url': cgi.escape(fields['url']),
+                'rooms': fields['rooms'],
+            }
+            event = previous.get(uid)
+            if existing[i]:
+                reason = 'Room conflict with %s' % existing[i][0].name
+            elif i in clashes:
+                reason = 'Room conflict with another imported event'
+            elif event and event.is_deleted():
+                reason = 'Deleted since an earlier import'
+            elif event and not [k for k in values if getattr(event, k) != values[k]]:
+                reason = 'Already imported'
+            else:
+                try:
+                    if event:
+                        previous_start = event.start_time
+                        for k in values:
+                            setattr(event, k, values[k])
+                        Event.flush_lists([event.status], previous_start)
+                        updated.append(event)
+                    else:
+                        imported.append(Event(
+                            type = cgi.escape(self.request.get('type')),
+                            estimated_size = self.request.get('estimated_size'),
+                            status = status,
+                            expired = local_today() + timedelta(days=PENDING_LIFETIME),
+                            import_uid = uid or None,
+                            **values))
+                    continue
+                except db.BadValueError, e:
+                    # e.g. a multiline name or an overlong url
+                    reason = str(e)
+            skipped.append({'uid': uid, 'name': fields['name'], 'reason': reason})
+        if imported or updated:
+            Event.put_all(imported + updated)
+            db.put([HDLog(event=event, description='Imported from %s' % source)
+                    for event in imported] +
+                   [HDLog(event=event, description='Updated from %s' % source)
+                    for event in updated])
+        self.response.out.write(template.render('templates/import.html', locals()))
+
+
+class PastHandler(webapp.RequestHandler):
+    def get(self, year=None, month=None):
         user = users.get_current_user()
         if user:
             logout_url = users.create_logout_url('/')
@@ -367,7 +624,29 @@ class PastHandler(webapp.RequestHandler):
             login_url = users.create_login_url('/')
         today = local_today()
         show_all_nav = user
-        events = Event.all().filter('start_time < ', today).order('-start_time')
+        start = None
+        end = today
+        try:
+            if month:
+                start = datetime(int(year), int(month), 1)
+                end = (start + timedelta(days=31)).replace(day=1)
+                previous_month = (start - timedelta(days=1)).replace(day=1)
+                if end < today:
+                    next_month = end
+            elif year:
+                start = datetime(int(year), 1, 1)
+                end = datetime(int(year) + 1, 1, 1)
+                months = [datetime(int(year), m, 1) for m in range(1, 13)
+                          if datetime(int(year), m, 1) < today]
+        except ValueError:
+            self.error(404)
+            return
+        # a month or year that ended before today no longer changes
+        closed = end < today
+        end = min(end, today)
+        events, cursor = Event.get_past_page(start, end, self.request.get('cursor') or None, closed)
+        if cursor:
+            next_page_url = '%s?cursor=%s' % (self.request.path, urllib.quote(cursor))
         self.response.out.write(template.render('templates/past.html', locals()))
 
 
@@ -386,7 +665,7 @@ class AllFutureHandler(webapp.RequestHandler):
         else:
             login_url = users.create_login_url('/')
         show_all_nav = user
-        events = Event.get_all_future_list()
+        events = Event.cached_list('all_future')
         today = local_today()
         tomorrow = today + timedelta(days=1)
         self.response.out.write(template.render('templates/all_future.html', locals()))
@@ -399,7 +678,7 @@ class LargeHandler(webapp.RequestHandler):
         else:
             login_url = users.create_login_url('/')
         show_all_nav = user
-        events = Event.get_large_list()
+        events = Event.cached_list('large')
         today = local_today()
         tomorrow = today + timedelta(days=1)
         self.response.out.write(template.render('templates/large.html', locals()))
@@ -412,7 +691,7 @@ class PendingHandler(webapp.RequestHandler):
             logout_url = users.create_logout_url('/')
         else:
             login_url = users.create_login_url('/')
-        events = Event.get_pending_list()
+        events = Event.cached_list('pending')
         show_all_nav = user
         today = local_today()
         tomorrow = today + timedelta(days=1)
@@ -451,10 +730,8 @@ class NewHandler(webapp.RequestHandler):
                 self.request.get('end_time_ampm')), '%m/%d/%Y %I:%M %p')
             conflicts = Event.check_conflict(start_time,end_time,self.request.get_all('rooms'))
             if conflicts:
-                if "Deck" in self.request.get_all('rooms') or "Savanna" in self.request.get_all('rooms'):
-                    raise ValueError('Room conflict detected <small>(Note: Deck &amp; Savanna share the same area, two events cannot take place at the same time in these rooms.)</small>')
-                else:
-                    raise ValueError('Room conflict detected')
+                suggestions = slot_suggestions(start_time, end_time, self.request.get_all('rooms'))
+                raise conflict_error(self.request.get_all('rooms'))
             if not self.request.get('estimated_size').isdigit():
               raise ValueError('Estimated number of people must be a number')
             if not int(self.request.get('estimated_size')) > 0:
@@ -480,6 +757,7 @@ class NewHandler(webapp.RequestHandler):
                     expired = local_today() + timedelta(days=PENDING_LIFETIME), # Set expected expiration date
                     )
                 event.put()
+                event.flush_cached_lists()
                 log = HDLog(event=event,description="Created new event")
                 log.put()
                 notify_owner_confirmation(event)
@@ -561,9 +839,12 @@ def main():
         ('/large', LargeHandler),
         ('/pending', PendingHandler),
         ('/past', PastHandler),
+        ('/past/(\d{4})', PastHandler),
+        ('/past/(\d{4})/(\d{1,2})', PastHandler),
         ('/cronbugowners', CronBugOwnersHandler),
         ('/myevents', MyEventsHandler),
         ('/new', NewHandler),
+        ('/import', ImportHandler),
         ('/confirm/(\d+).*', ConfirmationHandler),
         ('/edit/(\d+).*', EditHandler),
         # single event views
@@ -571,11 +852,17 @@ def main():
         ('/event/(\d+)\.json', EventHandler),
         # various export methods -- events.{json,rss,ics}
         ('/events\.(.+)', ExportHandler),
+        ('/api/events\.json', EventQueryHandler),
+        ('/export/events\.ndjson', HistoryExportHandler),
+        ('/members/([^/]+)/events\.(.+)', MemberExportHandler),
+        ('/rooms/([^/]+)/events\.(.+)', RoomExportHandler),
+        ('/rooms/([^/]+)/freebusy\.(ics|json)', FreeBusyHandler),
         #
         # CRON tasks
         ('/expire', ExpireCron),
         ('/expiring', ExpireReminderCron),
         ('/domaincache', DomainCacheCron),        
+        ('/migrate/(\w+)', MigrationHandler),
         ('/reminder', ReminderCron),
         #
         ('/logs', LogsHandler),
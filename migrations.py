@@ -0,0 +1,74 @@
+"""One-off datastore migrations, run in batches on the deferred queue.
+
+Start one by visiting /migrate/<name> as an admin.
+"""
+from google.appengine.ext import db, deferred
+
+from models import Event, Rsvp, RsvpCounter
+
+BATCH_SIZE = 100
+
+def reput_events(cursor=None):
+    """Re-put every Event so its derived properties are stored and indexed.
+
+    The caches built from queries on those properties before they were
+    stored are flushed by Event.put_all, batch by batch.
+    """
+    query = Event.all()
+    if cursor:
+        query.with_cursor(cursor)
+    events = query.fetch(BATCH_SIZE)
+    if events:
+        Event.put_all(events)
+        deferred.defer(reput_events, query.cursor())
+
+def rekey_rsvps(cursor=None):
+    """Move RSVPs created before they were keyed by member under their Event,
+    counting them in its RsvpCounter shards."""
+    query = Rsvp.all()
+    if cursor:
+        query.with_cursor(cursor)
+    rsvps = query.fetch(BATCH_SIZE)
+    legacy = [r for r in rsvps if r.key().parent() is None]
+    for rsvp in legacy:
+        event_key = Rsvp.event.get_value_for_datastore(rsvp)
+        key_name = Rsvp.key_name_for(rsvp.user)
+        def txn():
+            if Rsvp.get_by_key_name(key_name, parent=event_key):
+                return
+            event = Event.get(event_key)
+            if not event:
+                return
+            Rsvp(key_name=key_name, parent=event, event=event, user=rsvp.user,
+                 created=rsvp.created).put()
+            RsvpCounter.increment(event_key)
+        if event_key:
+            db.run_in_transaction(txn)
+    db.delete(legacy)
+    if rsvps:
+        deferred.defer(rekey_rsvps, query.cursor())
+
+def recount_rsvps(cursor=None):
+    """Count each Event's RSVPs into its RsvpCounter shards, replacing the
+    count formerly stored on the Event."""
+    query = Event.all(keys_only=True)
+    if cursor:
+        query.with_cursor(cursor)
+    event_keys = query.fetch(BATCH_SIZE)
+    for event_key in event_keys:
+        def txn():
+            count = Rsvp.all(keys_only=True).ancestor(event_key).count()
+            shards = RsvpCounter.key_names()
+            RsvpCounter(key_name=shards[0], parent=event_key, count=count).put()
+            db.delete([db.Key.from_path('RsvpCounter', name, parent=event_key)
+                       for name in shards[1:]])
+        db.run_in_transaction(txn)
+    if event_keys:
+        deferred.defer(recount_rsvps, query.cursor())
+
+MIGRATIONS = {
+    'attendance': reput_events,
+    'buckets': reput_events,
+    'rsvps': rekey_rsvps,
+    'rsvp_counters': recount_rsvps,
+}
@@ -1,8 +1,13 @@
 from google.appengine.ext import db
 from google.appengine.api import urlfetch, memcache, users, mail
+from google.appengine.datastore import entity_pb
 from datetime import datetime, timedelta
-from utils import human_username, local_today, to_sentence_list
+from utils import human_username, local_now, local_today, to_sentence_list
+from schedule import IntervalIndex, align, merge_intervals, nearest_free_slots
+from rooms import RoomRegistry
 import logging
+import random
+import time
 import pytz
 
 ROOM_OPTIONS = (
@@ -14,8 +19,105 @@ ROOM_OPTIONS = (
     ('Cubby 2', 2),
     ('Upstairs Office', 2),
     ('Front Area', 20))
+# Rooms in the same group are one physical area; booking one blocks the others
+SHARED_SPACES = (
+    ('Deck', 'Savanna'),)
+ROOMS = RoomRegistry(ROOM_OPTIONS, SHARED_SPACES)
 # GUESTS_PER_STAFF = 25
 PENDING_LIFETIME = 30 # days
+LARGE_EVENT_SIZE = 50 # people
+# Each status bucket is stored on Event as an indexed boolean, so the lists
+# and crons query one equality instead of fanning out a 'status IN'.
+STATUS_BUCKETS = {
+    'public_visible': ['approved', 'canceled'],
+    'listed': ['approved', 'canceled', 'pending', 'onhold'],
+    'pending_queue': ['pending', 'understaffed', 'onhold', 'expired'],
+    'blocks_rooms': ['approved', 'pending', 'onhold'],
+    'expirable': ['pending', 'understaffed'],
+}
+BLOCKING_STATUSES = STATUS_BUCKETS['blocks_rooms']
+ROOM_INDEX_KEY = 'room_index:%s' # generation
+ROOM_INDEX_GENERATION_KEY = 'room_index_generation'
+ROOM_INDEX_WRITTEN_KEY = 'room_index_written' # time of the last booking write
+ROOM_INDEX_TTL = 3600 # seconds
+# Queries may not see a write for a few seconds, so an index built that
+# soon after one is only kept briefly
+ROOM_INDEX_SETTLE_TIME = 10 # seconds
+ROOM_INDEX_SETTLING_TTL = 30 # seconds
+FREEBUSY_KEY = 'freebusy:%s:%s:%s' # room, day, room index build
+SUGGESTION_COUNT = 5
+SUGGESTION_DAYS = 7
+SUGGESTION_STEP = timedelta(minutes=15)
+# Statuses shown on each of the cached upcoming event lists
+LIST_STATUSES = {
+    'approved': STATUS_BUCKETS['public_visible'],
+    'large': STATUS_BUCKETS['public_visible'],
+    'all_future': STATUS_BUCKETS['listed'],
+    'pending': STATUS_BUCKETS['pending_queue'],
+}
+LIST_CACHE_KEY = 'list:%s:%s' # list name, local day
+LIST_CACHE_TTL = 86400 # seconds
+PAST_PAGE_SIZE = 50
+PAST_CACHE_KEY = 'past:%s:%s:%s' # window start, window end, cursor
+PAST_CACHE_TTL = 7 * 86400 # seconds
+CALENDAR_VERSION_KEY = 'calendar_version'
+PUT_BATCH_SIZE = 500 # entities, the most one datastore put takes
+IN_FILTER_SIZE = 30 # values, the most one IN filter takes
+RSVP_COUNTER_SHARDS = 5
+# Filters accepted by Event.query_page, mapped to the property they test.
+# Each has a <property>, start_time index so any mix of them can be merged.
+QUERY_FILTERS = {
+    'member': 'member',
+    'status': 'status',
+    'type': 'type',
+    'room': 'rooms',
+}
+QUERY_PAGE_SIZE = 50
+# Default window of the /events.* feeds
+FEED_PAST_DAYS = 2
+FEED_DEFAULT_LIMIT = 200
+FEED_MAX_LIMIT = 500
+FEED_BATCH_SIZE = 100
+HISTORY_PAGE_SIZE = 100
+QUERY_MAX_PAGE_SIZE = 200
+
+class DerivedProperty(db.Property):
+    """A read-only property computed from the rest of the entity.
+
+    The value is recomputed on every access and stored on every put, so it
+    can be indexed and filtered on like any other property. Values loaded
+    from the datastore are ignored.
+    """
+    def __init__(self, derive, *args, **kwargs):
+        super(DerivedProperty, self).__init__(*args, **kwargs)
+        self.derive = derive
+
+    def __get__(self, model_instance, model_class):
+        if model_instance is None:
+            return self
+        return self.derive(model_instance)
+
+    def __set__(self, model_instance, value):
+        pass
+
+
+def encode_entities(entities):
+    """Serialize entities compactly for memcache."""
+    return [db.model_to_protobuf(e).Encode() for e in entities]
+
+def decode_entities(data):
+    return [db.model_from_protobuf(entity_pb.EntityProto(pb)) for pb in data]
+
+
+def in_status_bucket(bucket):
+    return DerivedProperty(lambda self: self.status in STATUS_BUCKETS[bucket])
+
+
+def parse_size(estimated_size):
+    if estimated_size and estimated_size.isdigit():
+        return int(estimated_size)
+    return None
+
 
 class Event(db.Model):
     status  = db.StringProperty(required=True, default='pending', choices=set(
@@ -33,72 +135,400 @@ class Event(db.Model):
     notes       = db.TextProperty()
     type        = db.StringProperty(required=True)
     estimated_size = db.StringProperty(required=True)
+    attendance  = DerivedProperty(lambda self: parse_size(self.estimated_size))
+    large       = DerivedProperty(lambda self: (self.attendance or 0) >= LARGE_EVENT_SIZE)
+
+    public_visible  = in_status_bucket('public_visible')
+    listed          = in_status_bucket('listed')
+    pending_queue   = in_status_bucket('pending_queue')
+    blocks_rooms    = in_status_bucket('blocks_rooms')
+    expirable       = in_status_bucket('expirable')
     reminded    = db.BooleanProperty(default=False)
 
     contact_name    = db.StringProperty()
     contact_phone   = db.StringProperty()
+    # UID of the partner calendar VEVENT the event was imported from
+    import_uid      = db.StringProperty()
 
     expired = db.DateTimeProperty()
     created = db.DateTimeProperty(auto_now_add=True)
     updated = db.DateTimeProperty(auto_now=True)
 
+    @classmethod
+    def room_index(cls):
+        """Return the IntervalIndex of room bookings ending after today,
+        rebuilding it from the datastore when memcache does not have it.
+
+        The index is cached under the generation current when its query
+        started. Every write moves to a new generation, so an index built
+        while a booking was being written is never read afterwards.
+        """
+        today = local_today()
+        state = memcache.get_multi([ROOM_INDEX_GENERATION_KEY, ROOM_INDEX_WRITTEN_KEY])
+        generation = state.get(ROOM_INDEX_GENERATION_KEY)
+        if generation is None:
+            # a lost counter restarts from the clock, so it never goes back
+            # to a generation that may still be cached
+            generation = memcache.incr(ROOM_INDEX_GENERATION_KEY,
+                                       initial_value=int(time.time() * 1000))
+        key = ROOM_INDEX_KEY % generation
+        index = memcache.get(key)
+        if index is None or index.horizon != today:
+            bookings = []
+            for e in cls.all() \
+                    .filter('blocks_rooms =', True) \
+                    .filter('end_time >', today):
+                for r in e.rooms:
+                    bookings.append((r, e.start_time, e.end_time, e.key().id()))
+            index = IntervalIndex.from_bookings(today, bookings)
+            ttl = ROOM_INDEX_TTL
+            if time.time() - state.get(ROOM_INDEX_WRITTEN_KEY, 0) < ROOM_INDEX_SETTLE_TIME:
+                ttl = ROOM_INDEX_SETTLING_TTL
+            memcache.set(key, index, ttl)
+        return index
+
+    @classmethod
+    def flush_room_index(cls):
+        """Move the room index to a new generation after a booking write."""
+        memcache.set(ROOM_INDEX_WRITTEN_KEY, time.time(), ROOM_INDEX_TTL)
+        memcache.incr(ROOM_INDEX_GENERATION_KEY, initial_value=int(time.time() * 1000))
+
+    @classmethod
+    def busy_periods(cls, room, start, end):
+        """Return the merged (start, end) periods within [start, end) during
+        which room, or a room sharing its space, is booked.
+
+        Busy periods are cached per room and day for as long as the room
+        index they were computed from is current. Bookings that ended before
+        today are not in the index, and are queried for windows reaching
+        back that far.
+        """
+        index = cls.room_index()
+        rooms = ROOMS.names_in(ROOMS.closure_mask([room]))
+        days = {}
+        day = datetime(*start.timetuple()[:3])
+        while day < end:
+            days[FREEBUSY_KEY % (room, day.date(), index.built)] = day
+            day += timedelta(days=1)
+        cached = memcache.get_multi(days.keys())
+        missing = {}
+        for key, day in days.items():
+            if key not in cached:
+                missing[key] = index.busy(rooms, day, day + timedelta(days=1))
+        if missing:
+            memcache.set_multi(missing, ROOM_INDEX_TTL)
+        periods = []
+        for day_periods in cached.values() + missing.values():
+            periods.extend([(max(s, start), min(e, end)) for s, e in day_periods
+                            if s < end and e > start])
+        if start < index.horizon:
+            for e in cls.all() \
+                    .filter('blocks_rooms =', True) \
+                    .filter('end_time >', start) \
+                    .filter('end_time <=', index.horizon):
+                if e.start_time < end and set(e.rooms) & set(rooms):
+                    periods.append((max(e.start_time, start), min(e.end_time, end)))
+        return merge_intervals(periods)
+
+    @classmethod
+    def suggest_free_slots(cls, proposed_start_time, proposed_end_time, proposed_rooms,
+                           optional_existing_event_id=0, count=SUGGESTION_COUNT):
+        """Return up to count open (start_time, end_time, rooms) slots as long
+        as the proposed one, nearest to the proposed start first.
+
+        Slots are offered in the proposed rooms and in any single room that
+        holds at least as many people, within SUGGESTION_DAYS either side and
+        not before now.
+        """
+        duration = proposed_end_time - proposed_start_time
+        if not proposed_rooms or duration <= timedelta(0):
+            return []
+        capacity = sum([ROOMS.capacity.get(r, 0) for r in proposed_rooms])
+        options = [list(proposed_rooms)] + [[name] for name in ROOMS.names
+            if ROOMS.capacity[name] >= capacity and [name] != list(proposed_rooms)]
+        index = cls.room_index()
+        day = datetime(*proposed_start_time.timetuple()[:3])
+        # never suggest a slot that has already started
+        lo = max(day - timedelta(days=SUGGESTION_DAYS), align(local_now(), SUGGESTION_STEP, up=True))
+        hi = day + timedelta(days=SUGGESTION_DAYS + 1)
+        busy = {}
+        busy_by_option = []
+        for option in options:
+            periods = []
+            for room in ROOMS.names_in(ROOMS.closure_mask(option)):
+                if room not in busy:
+                    busy[room] = index.busy([room], lo, hi, exclude=optional_existing_event_id)
+                periods.extend(busy[room])
+            busy_by_option.append(merge_intervals(periods))
+        slots = nearest_free_slots(busy_by_option, proposed_start_time, duration,
+                                   count, lo, hi, SUGGESTION_STEP)
+        return [(start, start + duration, options[i]) for start, i in slots]
+
     @classmethod
     def check_conflict(cls,proposed_start_time,proposed_end_time,proposed_rooms,optional_existing_event_id = 0):
-      possible_conflicts = cls.all() \
-            .filter('end_time >', proposed_start_time) \
-            .filter('status IN', ['approved', 'pending', 'onhold'])
-      conflicts = []
-      if 'Deck' in proposed_rooms and 'Savanna' not in proposed_rooms:
-         proposed_rooms.append('Savanna')
-      if 'Savanna' in proposed_rooms and 'Deck' not in proposed_rooms:
-         proposed_rooms.append('Deck')
-      for e in possible_conflicts:
-        if e.key().id() != optional_existing_event_id:
-          if e.start_time < proposed_end_time:
-            for r in e.rooms:
-              if r in proposed_rooms:
-                if e not in conflicts:
-                  conflicts.append(e)
-      return conflicts
+      return cls.check_conflicts_bulk(
+          [(proposed_start_time, proposed_end_time, proposed_rooms)],
+          optional_existing_event_id)[0]
 
+    @classmethod
+    def check_conflicts_bulk(cls, slots, optional_existing_event_id=0):
+      """Check many proposed bookings at once.
+
+      Args:
+          slots: list of (start_time, end_time, rooms) proposals.
+          optional_existing_event_id: id of an event being edited, which
+              never conflicts with itself.
+
+      Returns a list parallel to slots holding the conflicting Events of each.
+      """
+      if not slots:
+        return []
+      blocked = [ROOMS.closure_mask(rooms) for start, end, rooms in slots]
+      index = cls.room_index()
+      candidates = index.candidates_many([(ROOMS.names_in(b), start, end)
+          for b, (start, end, rooms) in zip(blocked, slots)])
+      earliest = min([start for start, end, rooms in slots])
+      if earliest < index.horizon:
+        # the index only covers bookings that end after today
+        past_ids = set(e.key().id() for e in cls.all() \
+            .filter('blocks_rooms =', True) \
+            .filter('end_time >', earliest) \
+            .filter('end_time <=', index.horizon))
+        for ids, (start, end, rooms) in zip(candidates, slots):
+          if start < index.horizon:
+            ids.update(past_ids)
+      ids = set()
+      for c in candidates:
+        ids.update(c)
+      ids.discard(optional_existing_event_id)
+      # re-check the live entities in case the cached index is stale
+      ids = list(ids)
+      events = dict((i, (e, ROOMS.mask(e.rooms)))
+                    for i, e in zip(ids, cls.get_by_id(ids))
+                    if e and e.status in BLOCKING_STATUSES)
+      results = []
+      for c, b, (start, end, rooms) in zip(candidates, blocked, slots):
+        conflicts = [e for e, mask in map(events.get, c & set(events))
+                     if e.start_time < end and e.end_time > start and mask & b]
+        conflicts.sort(key=lambda e: e.start_time)
+        results.append(conflicts)
+      return results
 
     @classmethod
     def get_all_future_list(cls):
         return cls.all() \
+            .filter('listed =', True) \
             .filter('start_time >', local_today()) \
-            .filter('status IN', ['approved', 'canceled', 'pending', 'onhold']) \
             .order('start_time')
 
     @classmethod
     def get_large_list(cls):
-        future_list = Event.get_approved_list()
-        large_list = []
-        for e in future_list:
-          if int(e.estimated_size) >= 50:
-             large_list.append(e)
-        return large_list
+        return cls.all() \
+            .filter('large =', True) \
+            .filter('public_visible =', True) \
+            .filter('start_time >', local_today()) \
+            .order('start_time')
         
     @classmethod
     def get_approved_list(cls):
         return cls.all() \
+            .filter('public_visible =', True) \
             .filter('start_time >', local_today()) \
-            .filter('status IN', ['approved', 'canceled']) \
             .order('start_time')
 
     @classmethod
-    def get_recent_past_and_future(cls):
-        return cls.all() \
-            .filter('start_time >', local_today()  - timedelta(days=2)) \
-            .filter('status IN', ['approved', 'canceled']) \
-            .order('start_time').fetch(200)
+    def feed_window(cls):
+        """Return the default (start, end, limit) of the /events.* feeds."""
+        return local_today() - timedelta(days=FEED_PAST_DAYS), None, FEED_DEFAULT_LIMIT
+
+    @classmethod
+    def iter_feed(cls, start, end=None, limit=None, large_only=False, filters={},
+                  cursor=None, page=None):
+        """Generate the publicly visible events starting in [start, end),
+        oldest first, stopping after limit events if a limit is given.
+        filters narrows the feed down like the filters of query_page, and
+        cursor resumes a feed where an earlier one stopped.
+
+        Events are fetched FEED_BATCH_SIZE at a time, each batch resuming
+        from the cursor of the last, so a window of any length is streamed
+        whole rather than cut off at a single fetch. Once done, the cursor
+        to continue from is put in page['cursor'] if page is given, or None
+        if the window ran out before the limit.
+        """
+        query = cls.all()
+        if large_only:
+            query.filter('large =', True)
+        for name, value in filters.items():
+            query.filter('%s =' % QUERY_FILTERS[name], value)
+        query.filter('public_visible =', True).filter('start_time >=', start)
+        if end:
+            query.filter('start_time <', end)
+        query.order('start_time')
+        if cursor:
+            query.with_cursor(cursor)
+        count = 0
+        more = True
+        while more and (limit is None or count < limit):
+            size = FEED_BATCH_SIZE
+            if limit is not None:
+                size = min(size, limit - count)
+            batch = query.fetch(size)
+            for event in batch:
+                yield event
+            count += len(batch)
+            more = len(batch) == size
+            if more:
+                cursor = query.cursor()
+                query.with_cursor(cursor)
+        if page is not None:
+            page['cursor'] = more and cursor or None
+
+    @classmethod
+    def query_page(cls, filters, start=None, end=None, cursor=None, limit=QUERY_PAGE_SIZE):
+        """Return (events, next_cursor) for one page of the events matching
+        filters and starting in [start, end), oldest first. next_cursor is
+        None on the last page.
+
+        Args:
+            filters: dict of QUERY_FILTERS name to value. Unless a status is
+                given, only publicly visible events match.
+        """
+        query = cls.all()
+        for name, value in filters.items():
+            query.filter('%s =' % QUERY_FILTERS[name], value)
+        if 'status' not in filters:
+            query.filter('public_visible =', True)
+        if start:
+            query.filter('start_time >=', start)
+        if end:
+            query.filter('start_time <', end)
+        query.order('start_time')
+        if cursor:
+            query.with_cursor(cursor)
+        events = query.fetch(limit)
+        next_cursor = None
+        if len(events) == limit:
+            next_cursor = query.cursor()
+        return events, next_cursor
+
+    @classmethod
+    def get_history_page(cls, cursor=None):
+        """Return (events, next_cursor) for one page of every event ever
+        booked, in key order. next_cursor is None on the last page."""
+        query = cls.all().order('__key__')
+        if cursor:
+            query.with_cursor(cursor)
+        events = query.fetch(HISTORY_PAGE_SIZE)
+        next_cursor = None
+        if len(events) == HISTORY_PAGE_SIZE:
+            next_cursor = query.cursor()
+        return events, next_cursor
 
     @classmethod
     def get_pending_list(cls):
         return cls.all() \
+            .filter('pending_queue =', True) \
             .filter('start_time >', local_today()) \
-            .filter('status IN', ['pending', 'understaffed', 'onhold', 'expired']) \
             .order('start_time')
 
+    @classmethod
+    def cached_list(cls, name):
+        """Return the events of get_<name>_list() as a list, served from
+        memcache until the day rolls over or one of its events changes."""
+        key = LIST_CACHE_KEY % (name, local_today().date())
+        cached = memcache.get(key)
+        if cached is not None:
+            return decode_entities(cached)
+        events = list(getattr(cls, 'get_%s_list' % name)())
+        memcache.set(key, encode_entities(events), LIST_CACHE_TTL)
+        return events
+
+    @classmethod
+    def get_past_page(cls, start, end, cursor=None, closed=False):
+        """Return (events, next_cursor) for one page of the events starting
+        in [start, end), newest first. next_cursor is None on the last page.
+
+        Pages are cached if closed is set, for windows the caller knows
+        ended before today and so no longer change.
+        """
+        key = PAST_CACHE_KEY % (start, end, cursor)
+        if closed:
+            cached = memcache.get(key)
+            if cached is not None:
+                return decode_entities(cached[0]), cached[1]
+        query = cls.all().filter('start_time <', end)
+        if start:
+            query.filter('start_time >=', start)
+        query.order('-start_time')
+        if cursor:
+            query.with_cursor(cursor)
+        events = query.fetch(PAST_PAGE_SIZE)
+        next_cursor = None
+        if len(events) == PAST_PAGE_SIZE:
+            next_cursor = query.cursor()
+        if closed:
+            memcache.set(key, (encode_entities(events), next_cursor), PAST_CACHE_TTL)
+        return events, next_cursor
+
+    @classmethod
+    def flush_lists(cls, statuses, start_time):
+        """Drop the cached lists an event with any of statuses starting at
+        start_time appears on."""
+        today = local_today()
+        if not start_time or start_time <= today:
+            return
+        memcache.delete_multi([LIST_CACHE_KEY % (name, today.date())
+            for name, list_statuses in LIST_STATUSES.items()
+            if set(statuses).intersection(list_statuses)])
+
+    def flush_cached_lists(self, *previous_statuses):
+        Event.flush_lists([self.status] + list(previous_statuses), self.start_time)
+
+    @classmethod
+    def calendar_version(cls):
+        """Return the latest `updated` time of any Event.
+
+        Every write sets it in memcache, so the exports can answer
+        conditional requests without querying. A status change can hide an
+        event from the feeds, so events of every status count.
+        """
+        version = memcache.get(CALENDAR_VERSION_KEY)
+        if version is None:
+            latest = cls.all().order('-updated').get()
+            version = latest and latest.updated or datetime(1970, 1, 1)
+            memcache.add(CALENDAR_VERSION_KEY, version)
+        return version
+
+    def put(self, *args, **kwargs):
+        key = super(Event, self).put(*args, **kwargs)
+        Event.flush_room_index()
+        # auto_now stamps the stored entity, not this instance
+        memcache.set(CALENDAR_VERSION_KEY, db.DateTimeProperty.now())
+        return key
+
+    @classmethod
+    def get_imported(cls, uids):
+        """Return the events imported from any of the VEVENT uids, by UID."""
+        uids = list(set(uids))
+        imported = {}
+        for i in range(0, len(uids), IN_FILTER_SIZE):
+            for event in cls.all().filter('import_uid IN', uids[i:i + IN_FILTER_SIZE]):
+                imported[event.import_uid] = event
+        return imported
+
+    @classmethod
+    def put_all(cls, events):
+        """Store events with as few datastore calls as possible, doing the
+        same bookkeeping as put()."""
+        keys = []
+        for i in range(0, len(events), PUT_BATCH_SIZE):
+            keys.extend(db.put(events[i:i + PUT_BATCH_SIZE]))
+        cls.flush_room_index()
+        memcache.set(CALENDAR_VERSION_KEY, db.DateTimeProperty.now())
+        for event in events:
+            event.flush_cached_lists()
+        return keys
+
     def owner(self):
         return human_username(self.member)
         
@@ -147,6 +577,7 @@ class Event(db.Model):
 
     def approve(self):
         user = users.get_current_user()
+        previous_status = self.status
         if self.is_staffed():
             self.expired = None
             self.status = 'approved'
@@ -155,21 +586,38 @@ class Event(db.Model):
             self.status = 'understaffed'
             logging.info('%s approved %s but it is still understaffed' % (user.nickname, self.name))
         self.put()
+        self.flush_cached_lists(previous_status)
 
     def rsvp(self):
         user = users.get_current_user()
         if user and not self.has_rsvped():
-          rsvp = Rsvp(event=self)
-          rsvp.put()
+          key_name = Rsvp.key_name_for(user)
+          def txn():
+            if Rsvp.get_by_key_name(key_name, parent=self):
+              return False
+            Rsvp(key_name=key_name, parent=self, event=self, user=user).put()
+            RsvpCounter.increment(self.key())
+            return True
+          if db.run_in_transaction(txn) and hasattr(self, '_rsvp_count'):
+            self._rsvp_count += 1
+          self._has_rsvped = True
+
+    def rsvp_count(self):
+        # kept in RsvpCounter shards, so an RSVP never writes the Event and
+        # leaves its caches and the calendar version alone
+        if not hasattr(self, '_rsvp_count'):
+          self._rsvp_count = RsvpCounter.total(self.key())
+        return self._rsvp_count
 
     def has_rsvped(self):
         user = users.get_current_user()
         if not user:
           return False
-        for existing_rsvp in self.rsvps:
-          if existing_rsvp.user == user:
-             return True
-        return False
+        # templates ask several times per render; one key get is enough
+        if not hasattr(self, '_has_rsvped'):
+          self._has_rsvped = Rsvp.get_by_key_name(
+              Rsvp.key_name_for(user), parent=self) is not None
+        return self._has_rsvped
 
     # Works even for logged out users
     def can_rsvp(self):
@@ -181,59 +629,61 @@ class Event(db.Model):
                 
     def cancel(self):
         user = users.get_current_user()
+        previous_status = self.status
         self.status = 'canceled'
         self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s canceled %s' % (user.nickname, self.name))
 
     def on_hold(self):
         user = users.get_current_user()
+        previous_status = self.status
         self.status = 'onhold'
         self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s put %s on hold' % (user.nickname, self.name))
 
     def delete(self):
         user = users.get_current_user()
+        previous_status = self.status
         self.status = 'deleted'
         self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s deleted %s' % (user.nickname, self.name))
 
     def undelete(self):
         user = users.get_current_user()
+        previous_status = self.status
         self.status = 'pending'
         self.put()
-        logging.info('%s undeleted %s' % (user.nickname, self.name))
-
-    def delete(self):
-        user = users.get_current_user()
-        self.status = 'deleted'
-        self.put()
-        logging.info('%s deleted %s' % (user.nickname, self.name))
-
-    def undelete(self):
-        user = users.get_current_user()
-        self.status = 'pending'
-        self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s undeleted %s' % (user.nickname, self.name))
 
     def expire(self):
         user = users.get_current_user()
+        previous_status = self.status
         self.expired = datetime.now()
         self.status = 'expired'
         self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s expired %s' % (user.nickname, self.name))
 
     def add_staff(self, user):
+        previous_status = self.status
         self.staff.append(user)
         if self.is_staffed() and self.status == 'understaffed':
             self.status = 'approved'
         self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s staffed %s' % (user.nickname, self.name))
 
     def remove_staff(self, user):
+        previous_status = self.status
         self.staff.remove(user)
         if not self.is_staffed() and self.status == 'approved':
             self.status = 'understaffed'
         self.put()
+        self.flush_cached_lists(previous_status)
         logging.info('%s staffed %s' % (user.nickname, self.name))
 
     def to_dict(self, summarize=False):
@@ -263,10 +713,39 @@ class Feedback(db.Model):
     created = db.DateTimeProperty(auto_now_add=True)
 
 class Rsvp(db.Model):
+    """A member's RSVP, stored as a child of its Event under a key name
+    derived from the member, so looking one up is a single key get."""
     user    = db.UserProperty(auto_current_user_add=True)
     event   = db.ReferenceProperty(Event, collection_name='rsvps')
     created = db.DateTimeProperty(auto_now_add=True)
 
+    @staticmethod
+    def key_name_for(user):
+        return 'user:%s' % user.email().lower()
+
+class RsvpCounter(db.Model):
+    """One shard of an Event's RSVP count, stored as a child of the Event."""
+    count = db.IntegerProperty(default=0)
+
+    @staticmethod
+    def key_names():
+        return ['shard:%d' % i for i in range(RSVP_COUNTER_SHARDS)]
+
+    @classmethod
+    def increment(cls, event_key):
+        """Add one to a random shard. Must run in a transaction on the
+        Event's entity group."""
+        key_name = random.choice(cls.key_names())
+        counter = cls.get_by_key_name(key_name, parent=event_key) \
+            or cls(key_name=key_name, parent=event_key)
+        counter.count += 1
+        counter.put()
+
+    @classmethod
+    def total(cls, event_key):
+        return sum([c.count for c in cls.get_by_key_name(cls.key_names(), parent=event_key)
+                    if c])
+
 class HDLog(db.Model):
     event       = db.ReferenceProperty(Event)
     created     = db.DateTimeProperty(auto_now_add=True)
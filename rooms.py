@@ -0,0 +1,55 @@
+"""Registry of bookable rooms.
+
+Rooms are numbered in the order they are declared and every set of rooms is
+handled as an integer bitmask, with the "shares space with" relation folded
+into a per-room closure mask when the registry is built.
+"""
+
+
+class RoomRegistry(object):
+    """Room names, capacities and shared-space closures as bitmasks."""
+    def __init__(self, options, shared_spaces=()):
+        """Constructor.
+
+        Args:
+            options: sequence of (name, capacity) pairs, e.g. models.ROOM_OPTIONS.
+            shared_spaces: sequence of room name groups that occupy the same
+                physical space, so booking one of them blocks all of them.
+        """
+        self.names = [name for name, capacity in options]
+        self.capacity = dict(options)
+        self.bits = dict((name, 1 << i) for i, name in enumerate(self.names))
+        self.shared_spaces = [(self.mask(group), tuple(group)) for group in shared_spaces]
+        self.closure = dict(self.bits)
+        for group_mask, group in self.shared_spaces:
+            for name in group:
+                self.closure[name] |= group_mask
+
+    def mask(self, rooms):
+        """Return the bitmask of rooms. Unknown room names are ignored."""
+        mask = 0
+        for name in rooms:
+            mask |= self.bits.get(name, 0)
+        return mask
+
+    def closure_mask(self, rooms):
+        """Return the bitmask of every room blocked by booking rooms."""
+        mask = 0
+        for name in rooms:
+            mask |= self.closure.get(name, 0)
+        return mask
+
+    def names_in(self, mask):
+        """Return the room names in mask, in declaration order."""
+        return [name for name in self.names if self.bits[name] & mask]
+
+    def shared_space_note(self, rooms):
+        """Return a sentence explaining the shared spaces rooms touch, or ''
+        if none of them shares space with another room."""
+        mask = self.mask(rooms)
+        notes = []
+        for group_mask, group in self.shared_spaces:
+            if group_mask & mask:
+                notes.append('%s share the same area, two events cannot take '
+                             'place at the same time in these rooms.' % ' & '.join(group))
+        return ' '.join(notes)
@@ -0,0 +1,180 @@
+"""Interval bookkeeping for room scheduling.
+
+Nothing in here talks to App Engine, so the structures can be pickled into
+memcache by the models and exercised directly by the tests.
+"""
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import time
+
+
+def merge_intervals(intervals):
+    """Return the sorted union of (start, end) intervals, joining intervals
+    that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def align(t, step, up=False):
+    """Round t down, or up if up is set, to a multiple of step counted from
+    its midnight."""
+    midnight = datetime(*t.timetuple()[:3])
+    offset = (t - midnight).seconds
+    steps, rest = divmod(offset, step.seconds)
+    if up and rest:
+        steps += 1
+    return midnight + step * steps
+
+
+def nearest_free_slots(busy_by_option, start, duration, count, lo, hi, step):
+    """Find the free slots of length duration that start closest to start.
+
+    Args:
+        busy_by_option: list of merged busy period lists, one per room option.
+        start: preferred start time.
+        duration: timedelta length of a slot.
+        count: maximum number of slots to return.
+        lo, hi: datetimes bounding the search.
+        step: timedelta granularity of slot start times, counted from
+            midnight. Slots never end later than one step before midnight.
+
+    Each gap between busy periods contributes the single slot in it that is
+    closest to the requested time of day, so every option is scanned once. Returns a list of
+    (slot_start, option_index) sorted by distance from start, then option.
+    """
+    found = []
+    for i, busy in enumerate(busy_by_option):
+        free_from = lo
+        for busy_start, busy_end in busy + [(hi, hi)]:
+            gap_start = free_from
+            while gap_start < min(busy_start, hi):
+                midnight = datetime(*gap_start.timetuple()[:3]) + timedelta(days=1)
+                gap_end = min(busy_start, hi, midnight - step)
+                first = align(gap_start, step, up=True)
+                last = align(gap_end - duration, step) if gap_end - duration >= gap_start else None
+                if last is not None and first <= last:
+                    # prefer the requested time of day on every day
+                    preferred = align(datetime.combine(gap_start.date(), start.time()), step)
+                    found.append((min(max(preferred, first), last), i))
+                gap_start = midnight
+            free_from = max(free_from, busy_end)
+    found.sort(key=lambda f: (abs(f[0] - start), f[1]))
+    return found[:count]
+
+
+def sweep_conflicts(bookings):
+    """Find the bookings of a batch that clash with an earlier one of it.
+
+    Args:
+        bookings: list of (start, end, rooms_mask, blocked_mask), where
+            blocked_mask holds every room the booking keeps others out of.
+
+    Bookings are taken in start order and each one clashing with a booking
+    already taken is left out, so the result is the set of indexes into
+    bookings to drop. One pass over the sorted batch, keeping only the
+    bookings still running.
+    """
+    rejected = set()
+    running = []
+    for i in sorted(range(len(bookings)), key=lambda i: bookings[i][0]):
+        start, end, mask, blocked = bookings[i]
+        running = [r for r in running if r[0] > start]
+        if [r for r in running if r[1] & blocked]:
+            rejected.add(i)
+        elif end > start:
+            running.append((end, mask))
+    return rejected
+
+
+class IntervalIndex(object):
+    """Bookings grouped per room and sorted by start time.
+
+    Each room keeps a list of (start, end, event_id) tuples ordered by start,
+    a parallel list of the starts for bisecting, and the longest booking seen
+    so an overlap query never has to look further back than that.
+
+    Args:
+        horizon: datetime before which the index holds no bookings.
+    """
+    def __init__(self, horizon):
+        self.horizon = horizon
+        self.built = time.time()
+        self.intervals = {}
+        self.starts = {}
+        self.spans = {}
+
+    @classmethod
+    def from_bookings(cls, horizon, bookings):
+        """Build an index from an iterable of (room, start, end, event_id)."""
+        index = cls(horizon)
+        for room, start, end, event_id in bookings:
+            index.intervals.setdefault(room, []).append((start, end, event_id))
+        for room, intervals in index.intervals.items():
+            intervals.sort()
+            index.starts[room] = [i[0] for i in intervals]
+            index.spans[room] = max([i[1] - i[0] for i in intervals])
+        return index
+
+    def overlapping(self, room, start, end):
+        """Return the (start, end, event_id) bookings of room overlapping
+        the half-open window [start, end)."""
+        intervals = self.intervals.get(room)
+        if not intervals:
+            return []
+        starts = self.starts[room]
+        lo = bisect_left(starts, start - self.spans[room])
+        hi = bisect_left(starts, end)
+        return [i for i in intervals[lo:hi] if i[1] > start]
+
+    def busy(self, rooms, start, end, exclude=None):
+        """Return the merged periods during [start, end) in which any of
+        rooms is booked, clipped to the window. Bookings of the event id
+        exclude are ignored."""
+        periods = []
+        for room in rooms:
+            for s, e, event_id in self.overlapping(room, start, end):
+                if event_id != exclude:
+                    periods.append((max(s, start), min(e, end)))
+        return merge_intervals(periods)
+
+    def candidates(self, rooms, start, end):
+        """Return the set of event ids booked in any of rooms during
+        [start, end)."""
+        return self.candidates_many([(rooms, start, end)])[0]
+
+    def candidates_many(self, windows):
+        """Answer candidates() for a list of (rooms, start, end) windows.
+
+        The windows for each room are sorted and merged against that room's
+        bookings in a single forward pass, so N windows cost one sweep rather
+        than N separate lookups. Returns a list of id sets parallel to windows.
+        """
+        results = [set() for w in windows]
+        by_room = {}
+        for i, (rooms, start, end) in enumerate(windows):
+            for room in rooms:
+                by_room.setdefault(room, []).append((start, end, i))
+        for room, room_windows in by_room.items():
+            intervals = self.intervals.get(room)
+            if not intervals:
+                continue
+            span = self.spans[room]
+            room_windows.sort()
+            lo = 0
+            for start, end, i in room_windows:
+                # bookings starting a full span before this window ended
+                # before it, and before every later window too
+                while lo < len(intervals) and intervals[lo][0] < start - span:
+                    lo += 1
+                j = lo
+                while j < len(intervals) and intervals[j][0] < end:
+                    if intervals[j][1] > start:
+                        results[i].add(intervals[j][2])
+                    j += 1
+        return results
@@ -0,0 +1,50 @@
+import unittest, os, importer, pytz
+from datetime import datetime
+
+ROOM_NAMES = ['Cave', 'Deck', 'Savanna', '140b']
+
+class TestParseVevents(unittest.TestCase):
+	"""Unit tests for reading a partner calendar for the bulk import."""
+	def setUp(self):
+		f = open(os.path.join(os.path.dirname(__file__), 'partner.ics'), 'rb')
+		self.parsed = list(importer.parse_vevents(f, pytz.timezone('America/Los_Angeles'), ROOM_NAMES))
+		f.close()
+		self.by_uid = dict((uid, (fields, error)) for uid, fields, error in self.parsed)
+
+	def test_every_vevent_is_reported(self):
+		self.assertEqual([uid for uid, fields, error in self.parsed], ['talk-1@partner.example',
+			'hack-1@partner.example', 'study-1@partner.example', 'social-1@partner.example',
+			'meetup-1@partner.example', 'remote-1@partner.example'])
+
+	def test_utc_times_are_made_local(self):
+		fields, error = self.by_uid['talk-1@partner.example']
+		self.assertEqual(fields['name'], 'Lightning talks')
+		self.assertEqual(fields['start_time'], datetime(2026, 11, 1, 18))
+		self.assertEqual(fields['end_time'], datetime(2026, 11, 1, 20))
+		self.assertEqual(fields['details'], 'Five minutes each, bring slides.')
+		self.assertEqual(fields['url'], 'http://partner.example/talks')
+
+	def test_tzid_times_are_made_local(self):
+		fields, error = self.by_uid['meetup-1@partner.example']
+		self.assertEqual((fields['start_time'], fields['end_time']),
+			(datetime(2026, 11, 3, 16), datetime(2026, 11, 3, 18)))
+
+	def test_unknown_tzid_is_refused(self):
+		self.assertEqual(self.by_uid['remote-1@partner.example'],
+			(None, 'Unknown time zone Nowhere Standard Time'))
+
+	def test_location_names_rooms(self):
+		self.assertEqual(self.by_uid['talk-1@partner.example'][0]['rooms'], ['Deck', 'Savanna'])
+		self.assertEqual(self.by_uid['social-1@partner.example'][0]['rooms'], ['Cave', '140b'])
+
+	def test_all_day_and_duration(self):
+		fields, error = self.by_uid['hack-1@partner.example']
+		self.assertEqual((fields['start_time'], fields['end_time']),
+			(datetime(2026, 11, 7), datetime(2026, 11, 8)))
+		fields, error = self.by_uid['social-1@partner.example']
+		self.assertEqual((fields['start_time'], fields['end_time']),
+			(datetime(2026, 11, 4, 19), datetime(2026, 11, 4, 20, 30)))
+
+	def test_recurring_event_is_refused(self):
+		self.assertEqual(self.by_uid['study-1@partner.example'],
+			(None, 'Recurring events are not imported'))
@@ -0,0 +1,24 @@
+import unittest, rooms
+
+class TestRoomRegistry(unittest.TestCase):
+	"""Unit tests for the room bitmasks and shared-space closures."""
+	def setUp(self):
+		self.rooms = rooms.RoomRegistry(
+			(('Cave', 15), ('Deck', 30), ('Savanna', 120), ('140b', 129)),
+			(('Deck', 'Savanna'),))
+
+	def test_masks(self):
+		self.assertEqual(self.rooms.mask(['Cave', '140b']), 9)
+		self.assertEqual(self.rooms.mask(['Nowhere']), 0)
+		self.assertEqual(self.rooms.names_in(self.rooms.mask(['140b', 'Cave'])), ['Cave', '140b'])
+
+	def test_shared_space_closure(self):
+		self.assertEqual(self.rooms.names_in(self.rooms.closure_mask(['Deck'])), ['Deck', 'Savanna'])
+		self.assertEqual(self.rooms.names_in(self.rooms.closure_mask(['Savanna'])), ['Deck', 'Savanna'])
+		self.assertEqual(self.rooms.names_in(self.rooms.closure_mask(['Cave'])), ['Cave'])
+		self.assertTrue(self.rooms.mask(['Savanna']) & self.rooms.closure_mask(['Deck']))
+		self.assertFalse(self.rooms.mask(['Cave']) & self.rooms.closure_mask(['Deck']))
+
+	def test_shared_space_note(self):
+		self.assertEqual(self.rooms.shared_space_note(['Cave']), '')
+		self.assertTrue(self.rooms.shared_space_note(['Cave', 'Savanna']).startswith('Deck & Savanna'))
@@ -0,0 +1,111 @@
+import unittest, schedule
+from datetime import datetime, timedelta
+
+class TestIntervalIndex(unittest.TestCase):
+	"""Unit tests for the per-room booking index used by conflict checks."""
+	def setUp(self):
+		self.day = datetime(2010, 6, 1)
+		def at(hour):
+			return self.day + timedelta(hours=hour)
+		self.at = at
+		self.index = schedule.IntervalIndex.from_bookings(self.day, [
+			('Cave', at(18), at(20), 1),
+			('Cave', at(9), at(17), 2),
+			('Deck', at(19), at(21), 3),
+			('Cave', at(21), at(22), 4)])
+
+	def test_overlapping(self):
+		at = self.at
+		self.assertEqual(self.index.candidates(['Cave'], at(19), at(20)), set([1]))
+		self.assertEqual(self.index.candidates(['Cave'], at(16), at(19)), set([1, 2]))
+		self.assertEqual(self.index.candidates(['Cave', 'Deck'], at(20), at(22)), set([3, 4]))
+
+	def test_touching_is_not_overlapping(self):
+		at = self.at
+		self.assertEqual(self.index.candidates(['Cave'], at(17), at(18)), set())
+		self.assertEqual(self.index.candidates(['Cave'], at(20), at(21)), set())
+
+	def test_long_booking_found_from_inside(self):
+		at = self.at
+		self.assertEqual(self.index.candidates(['Cave'], at(12), at(13)), set([2]))
+
+	def test_unknown_room(self):
+		at = self.at
+		self.assertEqual(self.index.candidates(['Savanna'], at(0), at(24)), set())
+
+	def test_candidates_many(self):
+		at = self.at
+		windows = [
+			(['Cave'], at(21), at(23)),
+			(['Cave', 'Deck'], at(19), at(20)),
+			(['Deck'], at(8), at(9)),
+			(['Cave'], at(10), at(11))]
+		self.assertEqual(self.index.candidates_many(windows),
+			[set([4]), set([1, 3]), set(), set([2])])
+		for (rooms, start, end), ids in zip(windows, self.index.candidates_many(windows)):
+			self.assertEqual(self.index.candidates(rooms, start, end), ids)
+
+	def test_busy(self):
+		at = self.at
+		self.assertEqual(self.index.busy(['Cave', 'Deck'], at(12), at(24)),
+			[(at(12), at(17)), (at(18), at(22))])
+		self.assertEqual(self.index.busy(['Deck'], at(20), at(24)), [(at(20), at(21))])
+
+
+class TestMergeIntervals(unittest.TestCase):
+	def test_merge(self):
+		self.assertEqual(schedule.merge_intervals([(5, 7), (1, 3), (3, 4), (6, 9), (11, 12)]),
+			[(1, 4), (5, 9), (11, 12)])
+		self.assertEqual(schedule.merge_intervals([]), [])
+
+
+class TestNearestFreeSlots(unittest.TestCase):
+	def setUp(self):
+		self.day = datetime(2010, 6, 1)
+	def at(self, hour, minute=0, day=0):
+		return self.day + timedelta(days=day, hours=hour, minutes=minute)
+
+	def test_same_room_before_and_after(self):
+		at = self.at
+		busy = [[(at(18), at(20)), (at(21), at(22))]]
+		slots = schedule.nearest_free_slots(busy, at(19), timedelta(hours=1), 3,
+			self.day, self.day + timedelta(days=1), timedelta(minutes=15))
+		self.assertEqual(slots, [(at(20), 0), (at(17), 0), (at(22), 0)])
+
+	def test_other_option_at_same_time_wins(self):
+		at = self.at
+		busy = [[(at(18), at(20))], []]
+		slots = schedule.nearest_free_slots(busy, at(18, 30), timedelta(hours=1), 2,
+			self.day, self.day + timedelta(days=2), timedelta(minutes=15))
+		self.assertEqual(slots, [(at(18, 30), 1), (at(17), 0)])
+
+	def test_slots_stay_within_a_day(self):
+		at = self.at
+		busy = [[(at(20), at(23, 45))]]
+		slots = schedule.nearest_free_slots(busy, at(21), timedelta(hours=3), 2,
+			self.day, self.day + timedelta(days=2), timedelta(minutes=15))
+		self.assertEqual(slots, [(at(17), 0), (at(20, 45, day=1), 0)])
+		for start, option in slots:
+			self.assertEqual(start.date(), (start + timedelta(hours=3)).date())
+
+
+class TestSweepConflicts(unittest.TestCase):
+	def at(self, hour):
+		return datetime(2010, 6, 1) + timedelta(hours=hour)
+
+	def test_later_clash_is_dropped(self):
+		at = self.at
+		bookings = [
+			(at(19), at(21), 1, 1),
+			(at(18), at(20), 1, 1),
+			(at(20), at(22), 2, 2),
+			(at(20), at(21), 4, 6)]
+		self.assertEqual(schedule.sweep_conflicts(bookings), set([0, 3]))
+
+	def test_touching_and_roomless_bookings_pass(self):
+		at = self.at
+		bookings = [
+			(at(18), at(20), 1, 1),
+			(at(20), at(22), 1, 1),
+			(at(19), at(21), 0, 0)]
+		self.assertEqual(schedule.sweep_conflicts(bookings), set())
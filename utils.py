@@ -1,5 +1,6 @@
 from google.appengine.api import urlfetch, memcache
 from django.utils import simplejson
+from django.template.defaultfilters import slugify
 from datetime import datetime
 import re
 import pytz
@@ -26,6 +27,10 @@ def to_sentence_list(lst):
         return ' and '.join([pre_and, lst[-1]])
 
 
+def event_path(event):
+    return '/event/%s-%s' % (event.key().id(), slugify(event.name))
+
+
 def username(user):
     return user.nickname().split('@')[0] if user else None
 
@@ -42,11 +47,15 @@ def set_cookie(headers, name, value):
     headers.add_header('Set-Cookie', '%s=%s;' % (name, simplejson.dumps(value)))
 
 
+def local_now():
+    """Return a naive datetime object of the current local time."""
+    utc_now = pytz.utc.localize(datetime.utcnow())
+    return utc_now.astimezone(pytz.timezone(LOCAL_TZ)).replace(tzinfo=None)
+
+
 def local_today():
     """Return a datetime object representing the start of today, local time."""
-    utc_now = pytz.utc.localize(datetime.utcnow())
-    local_now = utc_now.astimezone(pytz.timezone(LOCAL_TZ))
-    return datetime(*local_now.timetuple()[:3])
+    return datetime(*local_now().timetuple()[:3])
 
 
 def get_phone_parts( in_phone, international_okay=False ):